@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+""" Measure how long `import pypes` takes in a fresh interpreter.
+
+    The logging module is imported before the clock starts, since every
+    program that logs pays for it anyway. What remains is the cost of pypes
+    itself, which should stay below IMPORT_BUDGET (the script exits with
+    an error otherwise):
+
+        python benchmarks/bench_import.py
+"""
+from __future__ import print_function
+
+import os
+import sys
+import subprocess
+
+IMPORT_BUDGET = 0.010 # seconds
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MEASURE = '''
+import logging, time
+started = time.time()
+import pypes
+print(time.time() - started)
+'''
+
+
+def import_time(repeat=5):
+    """ Return the best time (in seconds) of importing pypes. """
+    environ = dict(os.environ, PYTHONPATH=ROOT)
+    return min(
+        float(subprocess.check_output([sys.executable, '-c', MEASURE], env=environ))
+        for _ in range(repeat)
+    )
+
+
+def main():
+    seconds = import_time()
+    print('import pypes: {:.1f} ms (budget: {:.1f} ms)'.format(seconds * 1e3, IMPORT_BUDGET * 1e3))
+    if seconds > IMPORT_BUDGET:
+        sys.exit('importing pypes takes longer than its budget')
+
+
+if __name__ == '__main__': main()
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+""" Measure the per-segment overhead of PypeLine.process.
+
+    Run with the loglevel under test, for example:
+
+        LOGLEVEL=warning python benchmarks/bench_log_guard.py
+
+    The noop segments do no work, so the time per segment is the overhead
+    of the framework (wrapping, checking, logging and error handling).
+"""
+from __future__ import print_function
+
+import timeit
+
+from pypes import PypeLine
+from pypes import PypeSegment
+
+
+def per_segment_overhead(segments=100, number=2000, repeat=5):
+    """ Return the best time (in seconds) per segment and call. """
+    line = PypeLine([PypeSegment('noop') for _ in range(segments)], name='bench')
+    best = min(timeit.repeat(line.process, number=number, repeat=repeat))
+    return best / number / segments
+
+
+def main():
+    overhead = per_segment_overhead()
+    print('per-segment overhead: {:.3f} us'.format(overhead * 1e6))
+
+
+if __name__ == '__main__': main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+""" The pypes benchmark suite.
+
+    Measures the overhead of the framework itself (the segments do no work):
+
+        * per-segment call overhead of 1, 10 and 100 segment lines
+        * nesting PypeLines in PypeLines
+        * logging at every level, with and without <LEVEL>_LOGFILE sinks
+        * throughput of the compiled, streaming, batch and parallel runners
+          (the parallel ones at several worker counts and queue sizes)
+        * the time `import pypes` takes
+
+    Run it through `make bench`, or directly:
+
+        python benchmarks/run.py [--output results.json] [--quick]
+        python benchmarks/run.py --compare old.json new.json
+
+    The results are written as JSON (by default to benchmarks/results/,
+    named by the current commit), so runs can be compared across commits.
+"""
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import timeit
+import tempfile
+import argparse
+import platform
+import subprocess
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pypes import PypeLine
+from pypes import PypeSegment
+from pypes import setup_logger
+from pypes import logsetup
+
+from bench_import import import_time
+from bench_log_guard import per_segment_overhead
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+@contextmanager
+def quiet_stdout():
+    """ Let loggers created inside write to /dev/null instead of stdout. """
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout = devnull
+        try:
+            yield
+        finally:
+            sys.stdout = stdout
+
+def best_of(func, number, repeat):
+    """ The best time per call of func. """
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def bench_segments(scale):
+    """ Seconds per segment and call, for lines of different length. """
+    return dict(
+        ('segments-{}'.format(count), per_segment_overhead(count, number=max(1, 2000 * scale // count)))
+        for count in (1, 10, 100)
+    )
+
+def bench_nesting(scale):
+    """ Seconds per call of a single noop segment, nested depth times. """
+    results = {}
+    for depth in (1, 2, 4, 8):
+        line = PypeSegment('noop')
+        for level in range(depth):
+            line = PypeLine([line], name='nested-{}'.format(level))
+        results['nesting-{}'.format(depth)] = best_of(line.process, 200 * scale, 5)
+    return results
+
+def bench_logging(scale):
+    """ Seconds per log call at every level, with and without logfiles. """
+    results = {}
+    directory = tempfile.mkdtemp()
+    for sinks in ('stdout', 'files'):
+        for levelname in ('DEBUG', 'INFO', 'SUCCESS', 'WARNING', 'ERROR'):
+            environ = dict(os.environ)
+            os.environ['LOGLEVEL'] = 'INFO'
+            if sinks == 'files':
+                for filelevel in ('INFO', 'ERROR'):
+                    os.environ[filelevel + '_LOGFILE'] = os.path.join(directory, filelevel)
+            logsetup.reload_logconfig()
+            try:
+                with quiet_stdout():
+                    log = setup_logger('bench-{}-{}'.format(sinks, levelname))
+                    level = logsetup.levelnames[levelname]
+                    name = 'logging-{}-{}'.format(sinks, levelname.lower())
+                    results[name] = best_of(
+                        lambda: log.log(level, 'benchmark %s', 'message'), 200 * scale, 5,
+                    )
+            finally:
+                os.environ.clear()
+                os.environ.update(environ)
+                logsetup.reload_logconfig()
+    return results
+
+WORKER_COUNTS = (1, 2, 4, 8)
+QUEUE_SIZES = (1, 8, 64)
+
+def bench_runners(scale):
+    """ Records per second through the streaming and parallel runners.
+
+        The parallel runners are measured at every worker count (map) and
+        queue size (pipelined), so their scaling can be compared.
+    """
+    line = PypeLine([PypeSegment('noop') for _ in range(10)], name='runners')
+    compiled = line.compile()
+    records = list(range(1000 * scale))
+    runs = dict(
+        process=lambda: [line.process(record) for record in records],
+        compiled=lambda: [compiled(record) for record in records],
+        stream=lambda: list(line.stream(records)),
+        batch=lambda: list(line.stream(records, batch_size=100)),
+    )
+    for workers in WORKER_COUNTS:
+        for executor in ('thread', 'process'):
+            name = 'map_{}-workers-{}'.format(executor, workers)
+            runs[name] = lambda workers=workers, executor=executor: list(
+                line.map(records, workers=workers, executor=executor)
+            )
+    for queue_size in QUEUE_SIZES:
+        name = 'pipelined-queue-{}'.format(queue_size)
+        runs[name] = lambda queue_size=queue_size: list(line.pipelined(records, queue_size=queue_size))
+
+    results = {}
+    for name, run in sorted(runs.items()):
+        started = time.time()
+        run()
+        results['throughput-' + name] = len(records) / (time.time() - started)
+    return results
+
+def bench_import(scale):
+    """ Seconds to import pypes in a fresh interpreter. """
+    return {'import-pypes': import_time(repeat=5 * scale)}
+
+suite = [bench_segments, bench_nesting, bench_logging, bench_runners, bench_import]
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.STDOUT,
+        ).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def run_suite(scale):
+    results = {}
+    # the pypes loggers of the runners should not flood the terminal
+    os.environ.setdefault('LOGLEVEL', 'WARNING')
+    for benchmark in suite:
+        print('running', benchmark.__name__, file=sys.stderr)
+        results.update(benchmark(scale))
+    return dict(
+        commit=current_commit(),
+        timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'),
+        python=platform.python_version(),
+        scale=scale,
+        results=results,
+    )
+
+def compare(old_file, new_file):
+    """ Print the ratio new/old of every result. """
+    with open(old_file) as old, open(new_file) as new:
+        old, new = json.load(old), json.load(new)
+    print('{:<32} {:>14} {:>14} {:>8}'.format('benchmark', old['commit'], new['commit'], 'ratio'))
+    for name in sorted(set(old['results']) & set(new['results'])):
+        before, after = old['results'][name], new['results'][name]
+        print('{:<32} {:>14.4g} {:>14.4g} {:>8.2f}'.format(name, before, after, after / before))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', help='where to write the JSON results')
+    parser.add_argument('--quick', action='store_true', help='run fewer iterations')
+    parser.add_argument('--compare', nargs=2, metavar='JSON', help='compare two result files')
+    args = parser.parse_args()
+
+    if args.compare:
+        return compare(*args.compare)
+
+    report = run_suite(scale=1 if args.quick else 10)
+    output = args.output
+    if output is None:
+        if not os.path.isdir(RESULTS_DIR):
+            os.makedirs(RESULTS_DIR)
+        output = os.path.join(RESULTS_DIR, '{commit}-{timestamp}.json'.format(**report))
+    with open(output, 'w') as results:
+        json.dump(report, results, indent=2, sort_keys=True)
+
+    for name, value in sorted(report['results'].items()):
+        print('{:<32} {:.4g}'.format(name, value))
+    print('results written to', output, file=sys.stderr)
+
+
+if __name__ == '__main__': main()
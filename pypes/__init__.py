@@ -1,9 +1,46 @@
 from __future__ import absolute_import
 
+import sys
+from importlib import import_module
+
 from .logsetup import setup_logger
 from .pypes import PypeSegment
 from .pypes import PypeLine
 from .pypes import wrap_for_next_segment
 
-from ._version import get_version
-__version__ = get_version()
+# these are imported on first access, to keep `import pypes` cheap
+# (asyncio alone takes longer to import than all of pypes)
+lazy_imports = dict(
+    PypeGraph='.graph',
+    CachedSegment='.cache',
+    AsyncPypeSegment='.aiopypes',
+    AsyncPypeLine='.aiopypes',
+)
+
+def __getattr__(name):
+    """ Import the lazy attributes, and the version, on first access. """
+    if name == '__version__':
+        from ._version import get_version
+        value = get_version()
+    elif name in lazy_imports:
+        value = getattr(import_module(lazy_imports[name], __name__), name)
+    else:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(lazy_imports) | {'__version__'})
+
+if sys.version_info < (3, 7): # no module level __getattr__
+    try:
+        from .graph import PypeGraph
+    except ImportError: # python 2, without the futures backport
+        pass
+    from .cache import CachedSegment
+    try:
+        from .aiopypes import AsyncPypeSegment
+        from .aiopypes import AsyncPypeLine
+    except SyntaxError: # no async def before python 3.5
+        pass
+    __version__ = __getattr__('__version__')
@@ -0,0 +1,157 @@
+""" Asyncio flavoured PypeSegments and PypeLines (python 3.7+).
+
+    An AsyncPypeSegment defines process (and optionally check_inputs) as
+    coroutines. An AsyncPypeLine awaits them one after another, just like a
+    PypeLine calls its segments. Ordinary (synchronous) segments can be mixed
+    in, they are then run in a thread executor, so they do not block the
+    event loop.
+
+    Many inputs can be processed concurrently through amap, which limits
+    the number of inputs in flight by a semaphore. The synchronous ways
+    of running segments (stream, process_batch, map, pipelined, compile
+    and the like) would only produce un-awaited coroutines, so they
+    raise a TypeError instead.
+
+    >>> import asyncio
+    >>> class Hello(AsyncPypeSegment):
+    ...     async def process(self, name):
+    ...         await asyncio.sleep(0)
+    ...         return 'Hello, {}!'.format(name)
+    >>> pype = AsyncPypeLine([Hello('async'), PypeSegment('sync')], name='aio-test')
+    >>> asyncio.run(pype.amap(['World', 'Moon'], concurrency=1)) # doctest: +ELLIPSIS
+    [20] - AsyncPypeLine.aio-test - starting up
+    ...
+    [NextInput(args=('Hello, World!',), kwd={}), NextInput(args=('Hello, Moon!',), kwd={})]
+"""
+
+import asyncio
+from functools import partial
+
+from .pypes import NextInput
+from .pypes import PypeSegment
+from .pypes import PypeLine
+from .pypes import as_next_input
+from .pypes import overrides
+
+
+def synchronous_only(method_name):
+    """ A method, that refuses to call the coroutines of a segment synchronously. """
+    def refuse(self, *args, **kwd):
+        msg = '{} is async, await its process (or amap) instead of calling {}'
+        raise TypeError(msg.format(self, method_name))
+    refuse.__name__ = method_name
+    return refuse
+
+
+class AsyncPypeSegment(PypeSegment):
+
+    """ A (reusable) processing step, that can be awaited.
+
+        >>> p = AsyncPypeSegment('async-noop')
+        >>> asyncio.run(p.process('Hello'))
+        NextInput(args=('Hello',), kwd={})
+        >>> p.stream(['Hello'])
+        Traceback (most recent call last):
+        ...
+        TypeError: AsyncPypeSegment.async-noop is async, await its process (or amap) instead of calling stream
+    """
+
+    concurrency = 100
+
+    process_item = synchronous_only('process_item')
+    process_stream = synchronous_only('process_stream')
+    process_batch = synchronous_only('process_batch')
+    stream = synchronous_only('stream')
+    map = synchronous_only('map')
+    warm_pool = synchronous_only('warm_pool')
+
+    async def check_inputs(self, previous=None, *args, **kwd):
+        """ Called (and awaited) before processing, to allow early crashing. """
+
+    async def process(self, *args, **kwd):
+        """ Process inputs and deliver an output. """
+        return PypeSegment.process(self, *args, **kwd)
+
+    async def amap(self, inputs, concurrency=None):
+        """ Process many inputs concurrently, and return the outputs in order.
+
+            At most concurrency inputs are processed at the same time
+            (default: the concurrency attribute).
+        """
+        semaphore = asyncio.Semaphore(concurrency or self.concurrency)
+
+        async def bounded(data):
+            async with semaphore:
+                return await self.process(*data.args, **data.kwd)
+
+        return await asyncio.gather(*[
+            bounded(as_next_input(data)) for data in inputs
+        ])
+
+
+async def call_segment_method(segment, method_name, *args, **kwd):
+    """ Await a segment method, or run it in the default thread executor. """
+    method = getattr(segment, method_name)
+    if asyncio.iscoroutinefunction(method):
+        return await method(*args, **kwd)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, partial(method, *args, **kwd))
+
+
+class AsyncPypeLine(AsyncPypeSegment, PypeLine):
+
+    """ A chain of (reusable) processing steps, that can be awaited.
+
+        The segments may be AsyncPypeSegments or ordinary PypeSegments.
+
+        >>> pype = AsyncPypeLine([AsyncPypeSegment('noop')], name='aio')
+        >>> asyncio.run(pype.process())
+        [20] - AsyncPypeLine.aio - starting up
+        [20] - AsyncPypeLine.aio - AsyncPypeSegment.noop says input is ok
+        [20] - AsyncPypeLine.aio - AsyncPypeSegment.noop is done
+        [25] - AsyncPypeLine.aio - output was produced.
+        NextInput(args=(), kwd={})
+    """
+
+    pipelined = synchronous_only('pipelined')
+    compile = synchronous_only('compile')
+
+    async def check_inputs(self, previous=None, *args, **kwd):
+        """ Pass the check_inputs call to the first element. """
+        if self.segments:
+            return await self._check_inputs(self.segments[0], previous, args, kwd)
+
+    async def _check_inputs(self, segment, previous, args, kwd):
+        """ Skip checks of ordinary segments, that keep the default no-op. """
+        if overrides(segment, 'check_inputs'):
+            await call_segment_method(segment, 'check_inputs', previous, *args, **kwd)
+
+    async def process(self, *args, **kwd):
+        """ Process inputs and deliver an output. """
+
+        self.log.info('starting up')
+
+        data = NextInput(args, kwd)
+        previous = None
+
+        for segment in self.segments:
+
+            data = as_next_input(data)
+            self.log.debug('next input: %s', self._loggable(data))
+
+            try:
+                await self._check_inputs(segment, previous, data.args, data.kwd)
+                self.log.info('%s says input is ok', segment)
+
+                data = await call_segment_method(segment, 'process', *data.args, **data.kwd)
+                self.log.info('%s is done', segment)
+
+            except Exception:
+                self._segment_failed(segment, data)
+
+            previous = segment
+
+        self.log.success('output was produced.')
+        self.log.debug('output was %r', self._loggable(data))
+
+        return data
@@ -0,0 +1,128 @@
+""" Adaptive batch sizes for streaming records through segments.
+
+    With a fixed batch_size, small batches waste time on the overhead of
+    every process_batch call, and big ones make latency and memory spike.
+    An AutoBatcher measures the cost per record of every batch while the
+    stream is running, and grows (or shrinks) the size of the next batch
+    towards a target latency per batch, and optionally a memory budget for
+    the outputs of a batch. The size changes by no more than a factor of
+    growth per batch, so a single outlier does not throw it off.
+
+    Pass batch_size='auto' (or an AutoBatcher) to stream. A PypeLine that
+    collects statistics records the chosen sizes in its stats.
+
+    >>> batcher = AutoBatcher(target_latency=0.1, initial_size=10)
+    >>> batcher.update(10, 0.01) # 1ms per record, so 100 would be the target
+    >>> batcher.size
+    20
+    >>> batcher.update(20, 1.0) # 50ms per record now, so shrink again
+    >>> batcher.size
+    10
+
+    >>> from pypes.pypes import PypeLine, PypeSegment
+    >>> pype = PypeLine([PypeSegment('noop')], name='auto-batch', collect_stats=True)
+    >>> outputs = list(pype.stream(range(100), batch_size='auto')) # doctest: +ELLIPSIS
+    [20] - PypeLine.auto-batch - starting up with 16 records
+    ...
+    >>> len(outputs), sum(size * count for size, count in pype.stats.batch_sizes.items())
+    (100, 100)
+"""
+
+from .stats import payload_size
+from .stats import wall_clock
+
+from itertools import islice
+
+
+class AutoBatcher(object):
+
+    """ Chooses batch sizes from the measured cost per record.
+
+        Arguments (and class attributes):
+            target_latency - seconds, that processing a batch should take
+            memory_budget - bytes, that the outputs of a batch may take
+                            (not measured, if None)
+            initial_size, min_size, max_size - the bounds of the batch size
+            growth - how much the size may grow or shrink per batch
+            smoothing - the weight of a new measurement in the running
+                        averages of the costs (between 0 and 1)
+    """
+
+    target_latency = 0.1
+    memory_budget = None
+    initial_size = 16
+    min_size = 1
+    max_size = 65536
+    growth = 2.0
+    smoothing = 0.5
+
+    def __init__(self, target_latency=None, memory_budget=None,
+                 initial_size=None, min_size=None, max_size=None):
+        if target_latency is not None:
+            self.target_latency = target_latency
+        if memory_budget is not None:
+            self.memory_budget = memory_budget
+        if initial_size is not None:
+            self.initial_size = initial_size
+        if min_size is not None:
+            self.min_size = min_size
+        if max_size is not None:
+            self.max_size = max_size
+
+        self.size = max(self.min_size, min(self.max_size, self.initial_size))
+        self.record_cost = None
+        self.record_bytes = None
+
+    def __repr__(self):
+        return 'AutoBatcher(size={})'.format(self.size)
+
+    def _average(self, average, value):
+        return value if average is None else average + self.smoothing * (value - average)
+
+    def update(self, records, seconds, nbytes=None):
+        """ Adjust the size after a batch of records took seconds (and its outputs nbytes). """
+        if not records:
+            return
+
+        wanted = self.max_size
+
+        self.record_cost = self._average(self.record_cost, float(seconds) / records)
+        if self.target_latency and self.record_cost > 0:
+            wanted = self.target_latency / self.record_cost
+
+        if self.memory_budget and nbytes is not None:
+            self.record_bytes = self._average(self.record_bytes, float(nbytes) / records)
+            if self.record_bytes > 0:
+                wanted = min(wanted, self.memory_budget / self.record_bytes)
+
+        wanted = max(self.size / self.growth, min(self.size * self.growth, wanted))
+        self.size = int(max(self.min_size, min(self.max_size, wanted)))
+
+    def batches(self, iterable):
+        """ Chunk iterable into batches of the current size. """
+        iterator = iter(iterable)
+        while True:
+            batch = list(islice(iterator, self.size))
+            if not batch:
+                return
+            yield batch
+
+
+def auto_batch_stream(segment, iterable, batcher='auto'):
+    """ Stream iterable through segment.process_batch, in adaptive batches.
+
+        batcher may be an AutoBatcher, or 'auto' for one with the defaults.
+    """
+    if batcher == 'auto':
+        batcher = AutoBatcher()
+    elif not isinstance(batcher, AutoBatcher):
+        raise ValueError('batch_size must be an int, \'auto\' or an AutoBatcher, not {!r}'.format(batcher))
+
+    measure_bytes = bool(batcher.memory_budget)
+    for batch in batcher.batches(iterable):
+        started = wall_clock()
+        outputs = segment.process_batch(batch)
+        nbytes = sum(map(payload_size, outputs)) if measure_bytes else None
+        batcher.update(len(batch), wall_clock() - started, nbytes)
+        for data in outputs:
+            yield data
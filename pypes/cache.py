@@ -0,0 +1,256 @@
+""" Memoization of segment outputs.
+
+    Wrapping a segment in a CachedSegment stores its outputs in a cache,
+    keyed by a stable hash of the segment (its str and a version, that should
+    be bumped whenever the processing changes) and of its inputs. Processing
+    the same inputs again then returns the stored output, instead of
+    recomputing it.
+
+    Outputs are stored pickled, so a cached output can not be changed by
+    modifying a returned one. Inputs, that can not be pickled, are just
+    processed and not cached. The inputs are hashed the same in every
+    process, as long as they are built of (nested) scalars, strings, bytes,
+    lists, tuples, sets and dicts. Other objects are hashed by their pickle,
+    which may differ between processes (say, if they hold sets).
+
+    Two caches are included:
+        * MemoryCache:
+            An in-memory LRU cache, that evicts the least recently used
+            outputs, when max_bytes (or max_items) is exceeded.
+        * DiskCache:
+            Stores every output as a file in a directory, so it also
+            persists between runs.
+
+    Both count their hits and misses.
+
+    >>> cached = CachedSegment(PypeSegment('expensive'), cache=MemoryCache())
+    >>> cached.process('input')
+    NextInput(args=('input',), kwd={})
+    >>> cached.process('input')
+    NextInput(args=('input',), kwd={})
+    >>> cached.cache.stats()
+    {'hits': 1, 'misses': 1, 'items': 1}
+"""
+
+from .pypes import PypeSegment
+
+import io
+import os
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+
+PICKLE_PROTOCOL = 2
+
+# values of these types pickle the same in every process
+SCALARS = frozenset([type(None), bool, int, float, complex, str, bytes, type(u'')])
+
+
+def stable_dumps(obj):
+    """ Pickle obj without memo references, so equal objects pickle the same.
+
+        (With the memo, the pickle depends on which parts of obj are
+        identical objects, and not just equal ones.)
+    """
+    stream = io.BytesIO()
+    pickler = pickle.Pickler(stream, PICKLE_PROTOCOL)
+    pickler.fast = True
+    pickler.dump(obj)
+    return stream.getvalue()
+
+def canonical(obj):
+    """ An equivalent of obj, whose pickle does not depend on the hash seed.
+
+        The elements of sets and the items of dicts are sorted (by their
+        pickles, so they need not be comparable), and containers are tagged
+        by their type.
+
+        >>> canonical({'b': {2, 1}, 'a': [()]})
+        ('dict', (('tuple', ('a', ('list', (('tuple', ()),)))), ('tuple', ('b', ('set', (1, 2))))))
+    """
+    if isinstance(obj, (set, frozenset)):
+        return type(obj).__name__, sorted_canonical(obj)
+    if isinstance(obj, dict):
+        return type(obj).__name__, sorted_canonical(obj.items())
+    if isinstance(obj, (list, tuple)):
+        if set(map(type, obj)) <= SCALARS: # the common case of flat sequences
+            return type(obj).__name__, tuple(obj)
+        return type(obj).__name__, tuple(canonical(element) for element in obj)
+    return obj
+
+def sorted_canonical(elements):
+    return tuple(sorted((canonical(element) for element in elements), key=stable_dumps))
+
+def cache_key(segment, version, args, kwd):
+    """ A stable hash of the segment identity and its inputs.
+
+        >>> cache_key('a', 1, (1,), {'x': 1, 'y': 2}) == cache_key('a', 1, (1,), {'y': 2, 'x': 1})
+        True
+        >>> cache_key('a', 1, (1,), {}) == cache_key('a', 2, (1,), {})
+        False
+        >>> cache_key('a', 1, ([1],), {}) == cache_key('a', 1, ((1,),), {})
+        False
+    """
+    identity = (str(segment), version, canonical(tuple(args)), canonical(kwd))
+    return hashlib.sha256(stable_dumps(identity)).hexdigest()
+
+
+class MemoryCache(object):
+
+    """ An in-memory LRU cache, bounded by the size of the pickled outputs.
+
+        >>> cache = MemoryCache(max_bytes=100)
+        >>> cache.set('small', b'x' * 50)
+        >>> cache.set('too-big', b'x' * 500)
+        >>> cache.get('small') == b'x' * 50
+        True
+        >>> cache.get('too-big')
+        Traceback (most recent call last):
+        ...
+        KeyError: 'too-big'
+
+        Copies (say, of a CachedSegment shipped to a worker process) start
+        out with the values stored so far:
+
+        >>> import pickle
+        >>> pickle.loads(pickle.dumps(cache)).get('small') == b'x' * 50
+        True
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_items=None):
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.size = 0
+        self.hits = self.misses = 0
+        self._store = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        """ Locks can not be pickled, a copy gets a new one. """
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ Return the value stored under key, or raise a KeyError. """
+        with self._lock:
+            try:
+                value = self._store.pop(key)
+            except KeyError:
+                self.misses += 1
+                raise
+            self._store[key] = value
+            self.hits += 1
+        return pickle.loads(value)
+
+    def set(self, key, value):
+        """ Store value under key, and evict the least recently used values. """
+        value = pickle.dumps(value, PICKLE_PROTOCOL)
+        if self.max_bytes is not None and len(value) > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._store:
+                self.size -= len(self._store.pop(key))
+            self._store[key] = value
+            self.size += len(value)
+
+            while self._store and (
+                (self.max_bytes is not None and self.size > self.max_bytes) or
+                (self.max_items is not None and len(self._store) > self.max_items)
+            ):
+                _, evicted = self._store.popitem(last=False)
+                self.size -= len(evicted)
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, items=len(self._store))
+
+
+class DiskCache(object):
+
+    """ A cache, that stores every value pickled in a file in directory.
+
+        >>> import tempfile
+        >>> cache = DiskCache(tempfile.mkdtemp())
+        >>> cache.set('key', [1, 2, 3])
+        >>> cache.get('key')
+        [1, 2, 3]
+        >>> cache.stats()
+        {'hits': 1, 'misses': 0, 'items': 1}
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = self.misses = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pickle')
+
+    def get(self, key):
+        """ Return the value stored under key, or raise a KeyError. """
+        try:
+            with open(self._path(key), 'rb') as stored:
+                value = pickle.load(stored)
+        except (IOError, OSError):
+            self.misses += 1
+            raise KeyError(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """ Store value under key (atomically, by renaming a temporary file). """
+        path = self._path(key)
+        temporary = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temporary, 'wb') as stored:
+            pickle.dump(value, stored, PICKLE_PROTOCOL)
+        os.rename(temporary, path)
+
+    def stats(self):
+        items = sum(1 for filename in os.listdir(self.directory) if filename.endswith('.pickle'))
+        return dict(hits=self.hits, misses=self.misses, items=items)
+
+
+class CachedSegment(PypeSegment):
+
+    """ Wraps a segment, and memoizes its outputs in cache.
+
+        The version should be changed, when the processing of the wrapped
+        segment changes, so outdated outputs are no longer used.
+    """
+
+    def __init__(self, segment, cache=None, version=None, name=None):
+        self.segment = segment
+        self.cache = MemoryCache() if cache is None else cache
+        self.version = version
+        super(CachedSegment, self).__init__(str(segment) if name is None else name)
+
+    def check_inputs(self, previous=None, *args, **kwd):
+        """ Pass the check_inputs call to the wrapped segment. """
+        return self.segment.check_inputs(previous, *args, **kwd)
+
+    def process(self, *args, **kwd):
+        """ Return the cached output, or process and cache it. """
+        try:
+            key = cache_key(self.segment, self.version, args, kwd)
+        except Exception:
+            self.log.debug('inputs can not be hashed, not caching.', exc_info=True)
+            return self.segment.process(*args, **kwd)
+
+        try:
+            return self.cache.get(key)
+        except KeyError:
+            pass
+
+        data = self.segment.process(*args, **kwd)
+        try:
+            self.cache.set(key, data)
+        except Exception:
+            self.log.debug('output can not be stored, not caching.', exc_info=True)
+        return data
@@ -0,0 +1,179 @@
+""" Checkpoints for long running PypeLines.
+
+    A PypeLine with a CheckpointStore saves the output of every segment,
+    keyed by the pipeline, a fingerprint of the input and the index of the
+    segment. When the same line processes the same input again (say after
+    segment 7 of 8 crashed), it resumes after the last segment, whose
+    output was saved, instead of recomputing everything.
+
+    How outputs are saved is up to the serializer of the store:
+        * PickleSerializer:
+            Pickles any output (the default).
+        * NumpySerializer:
+            Saves numpy arrays as .npy files, which are loaded memory-mapped,
+            so resuming after a big intermediate result is cheap. Other
+            outputs are pickled.
+
+    >>> import tempfile
+    >>> store = CheckpointStore(tempfile.mkdtemp())
+    >>> from pypes.pypes import PypeLine, PypeSegment
+    >>> pype = PypeLine([PypeSegment('one'), PypeSegment('two')], name='ckpt', checkpoints=store)
+    >>> pype.process('input')
+    [20] - PypeLine.ckpt - starting up
+    [20] - PypeLine.ckpt - PypeSegment.one says input is ok
+    [20] - PypeLine.ckpt - PypeSegment.one is done
+    [20] - PypeLine.ckpt - PypeSegment.two says input is ok
+    [20] - PypeLine.ckpt - PypeSegment.two is done
+    [25] - PypeLine.ckpt - output was produced.
+    NextInput(args=('input',), kwd={})
+    >>> pype.process('input')
+    [20] - PypeLine.ckpt - starting up
+    [20] - PypeLine.ckpt - resuming after PypeSegment.two
+    [25] - PypeLine.ckpt - output was produced.
+    NextInput(args=('input',), kwd={})
+
+    It resumes after the last successful segment: if a segment fails (and
+    the line continues on errors), neither its output, nor the ones of the
+    later segments are saved, so a rerun retries the failed segment.
+
+    >>> import logging
+    >>> class Flaky(PypeSegment):
+    ...     failures = 1
+    ...     def process(self, data):
+    ...         if Flaky.failures:
+    ...             Flaky.failures -= 1
+    ...             raise IOError('not yet')
+    ...         return data + '!'
+    >>> pype = PypeLine(
+    ...     [PypeSegment('first'), Flaky('flaky'), PypeSegment('last')],
+    ...     name='ckpt-retry', checkpoints=store, continue_on_errors=True,
+    ... )
+    >>> pype.log.setLevel(logging.CRITICAL)
+    >>> pype.process('input'), pype.process('input')
+    (NextInput(args=('input',), kwd={}), NextInput(args=('input!',), kwd={}))
+    >>> store.resume(pype, store.fingerprint(pype, NextInput(('input',), {})))[0]
+    2
+"""
+
+from .cache import cache_key
+from .pypes import NextInput
+
+import os
+import pickle
+import shutil
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class PickleSerializer(object):
+
+    """ Save any (picklable) output as a pickle file. """
+
+    extension = '.pickle'
+
+    def dump(self, data, path):
+        with open(path + self.extension, 'wb') as stored:
+            pickle.dump(data, stored, pickle.HIGHEST_PROTOCOL)
+        return path + self.extension
+
+    def load(self, path):
+        with open(path + self.extension, 'rb') as stored:
+            return pickle.load(stored)
+
+
+class NumpySerializer(PickleSerializer):
+
+    """ Save numpy arrays as .npy files, and load them memory-mapped. """
+
+    array_extension = '.npy'
+
+    def __init__(self, mmap_mode='r'):
+        if numpy is None:
+            raise ImportError('the NumpySerializer needs numpy to be installed')
+        self.mmap_mode = mmap_mode
+
+    def dump(self, data, path):
+        if not isinstance(data, numpy.ndarray):
+            return super(NumpySerializer, self).dump(data, path)
+        with open(path + self.array_extension, 'wb') as stored:
+            numpy.save(stored, data)
+        return path + self.array_extension
+
+    def load(self, path):
+        if os.path.exists(path + self.array_extension):
+            return numpy.load(path + self.array_extension, mmap_mode=self.mmap_mode)
+        return super(NumpySerializer, self).load(path)
+
+
+class CheckpointStore(object):
+
+    """ Saves segment outputs in a directory tree:
+
+            <directory>/<pipeline>/<input fingerprint>/<segment index>.<ext>
+    """
+
+    def __init__(self, directory, serializer=None):
+        self.directory = directory
+        self.serializer = PickleSerializer() if serializer is None else serializer
+
+    def fingerprint(self, line, data):
+        """ A stable hash of the input of line.
+
+            It is the same in every process (see pypes.cache.cache_key), so
+            a rerun resumes, even if the input holds sets or dicts:
+
+            >>> import os, sys, subprocess, tempfile
+            >>> script = '''if True:
+            ...     import sys
+            ...     from pypes.pypes import PypeLine, PypeSegment
+            ...     from pypes.checkpoint import CheckpointStore
+            ...     pype = PypeLine([PypeSegment('one')], name='ckpt-rerun', checkpoints=CheckpointStore(sys.argv[1]))
+            ...     pype.process({'alpha', 'beta', 'gamma'}, options={'x': 1, 'y': 2})
+            ... '''
+            >>> def run(directory, seed):
+            ...     package = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            ...     env = dict(os.environ, PYTHONHASHSEED=str(seed), PYTHONPATH=package)
+            ...     output = subprocess.check_output([sys.executable, '-c', script, directory], env=env)
+            ...     return b'resuming after' in output
+            >>> directory = tempfile.mkdtemp()
+            >>> run(directory, 1), run(directory, 2), run(directory, 3)
+            (False, True, True)
+        """
+        return cache_key(line, None, data.args, data.kwd)
+
+    def _path(self, line, fingerprint, index=None):
+        path = os.path.join(self.directory, str(line), fingerprint)
+        return path if index is None else os.path.join(path, str(index))
+
+    def save(self, line, fingerprint, index, data):
+        """ Save the output of the segment at index (via a temporary name). """
+        directory = self._path(line, fingerprint)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        temporary = os.path.join(directory, 'tmp.{}.{}'.format(index, os.getpid()))
+        written = self.serializer.dump(data, temporary)
+        final = self._path(line, fingerprint, index) + written[len(temporary):]
+        os.rename(written, final)
+
+    def resume(self, line, fingerprint, count=None):
+        """ Return (index, output) of the last saved segment, or (None, None).
+
+            count is the number of segments (default: len(line.segments)).
+        """
+        count = len(line.segments) if count is None else count
+        for index in reversed(range(count)):
+            try:
+                return index, self.serializer.load(self._path(line, fingerprint, index))
+            except (IOError, OSError):
+                continue
+        return None, None
+
+    def clear(self, line, fingerprint=None):
+        """ Remove the checkpoints of line (for one input fingerprint only, if given). """
+        path = self._path(line, fingerprint) if fingerprint else os.path.join(self.directory, str(line))
+        if os.path.isdir(path):
+            shutil.rmtree(path)
@@ -0,0 +1,109 @@
+""" Compiled execution plans for PypeLines.
+
+    PypeLine.process walks its segments on every call, logs every step, and
+    nested PypeLines do the same again. When a (small) line is run very many
+    times, that overhead dominates. PypeLine.compile builds a plan once:
+
+        * nested PypeLines are flattened into their leaf segments
+        * check_inputs calls are dropped, where a segment keeps the no-op
+          default of PypeSegment
+        * the bound methods are looked up once, and the whole chain is run
+          by one tight loop
+
+    The compiled line is quiet: it neither logs on the INFO and DEBUG
+    levels, nor collects statistics or checkpoints. Failures are still
+    handled like in process, by the line the failing segment belongs to
+    (respecting its continue_on_errors). A nested line checks the inputs
+    of its first segment only once, instead of once from the outer line
+    and once more from itself. Nested lines, that are not flattened for
+    their own error handling (see pypes.pypes.flatten), are compiled into
+    plans of their own.
+
+    The plan does not follow later changes of the segments lists, so
+    compile again after modifying them. Only lines, that process their
+    segments as a plain chain, can be compiled (not a PypeGraph, say).
+
+    >>> import logging
+    >>> from pypes.pypes import PypeLine, PypeSegment
+    >>> inner = PypeLine([PypeSegment('one'), PypeSegment('two')], name='inner')
+    >>> outer = PypeLine([inner, PypeSegment('three')], name='outer')
+    >>> compiled = outer.compile()
+    >>> len(compiled.steps)
+    3
+    >>> compiled('input')
+    NextInput(args=('input',), kwd={})
+
+    >>> class Fail(PypeSegment):
+    ...     def process(self, data):
+    ...         raise ValueError(data)
+    >>> strict = PypeLine([Fail('compile-fail')], name='compile-strict')
+    >>> lenient = PypeLine([strict, PypeSegment('after')], name='compile-lenient', continue_on_errors=True)
+    >>> strict.log.setLevel(logging.CRITICAL); lenient.log.setLevel(logging.CRITICAL)
+    >>> lenient.compile()('input') == lenient.process('input')
+    True
+
+    >>> from pypes.graph import PypeGraph
+    >>> PypeGraph(name='compile-graph').compile()
+    Traceback (most recent call last):
+    ...
+    TypeError: PypeGraph.compile-graph can not be compiled, since it does not process its segments as a chain
+"""
+
+from .pypes import NextInput
+from .pypes import flatten
+from .pypes import is_chain
+from .pypes import is_flattenable
+from .pypes import overrides
+
+from collections import namedtuple
+
+
+PlanStep = namedtuple('PlanStep', ['check', 'process', 'previous', 'failed', 'segment'])
+
+
+class CompiledPypeLine(object):
+
+    """ A fused, quiet execution plan of a PypeLine. """
+
+    def __init__(self, line):
+        if not is_chain(line):
+            msg = '{} can not be compiled, since it does not process its segments as a chain'
+            raise TypeError(msg.format(line))
+        self.line = line
+        self.steps = []
+
+        previous = None
+        for owner, segment in flatten(line):
+            check = segment.check_inputs if overrides(segment, 'check_inputs') else None
+            process = segment.process
+            if is_flattenable(segment): # kept for its own error handling
+                process = CompiledPypeLine(segment).process
+            self.steps.append(PlanStep(
+                check, process, previous, owner._segment_failed, segment,
+            ))
+            previous = segment
+
+        self.steps = tuple(self.steps)
+
+    def __str__(self):
+        return 'compiled {}'.format(self.line)
+
+    def process(self, *args, **kwd):
+        """ Process inputs and deliver an output (like line.process). """
+        data = NextInput(args, kwd)
+
+        for check, process, previous, failed, segment in self.steps:
+
+            if not isinstance(data, NextInput):
+                data = NextInput([data], {})
+
+            try:
+                if check is not None:
+                    check(previous, *data.args, **data.kwd)
+                data = process(*data.args, **data.kwd)
+            except Exception:
+                failed(segment, data)
+
+        return data
+
+    __call__ = process
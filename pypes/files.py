@@ -0,0 +1,365 @@
+""" Segments to read (and write) files larger than memory.
+
+    The sources map their files with mmap, so the operating system pages the
+    data in lazily (and drops it again under memory pressure), instead of
+    the whole file being read at once:
+
+        * RecordSource:
+            fixed size binary records (optionally unpacked with a struct format)
+        * LineSource:
+            line-delimited text
+        * NpySource:
+            numpy .npy files, loaded memory-mapped (needs numpy)
+
+    A source processes a path into an iterator of records. Streamed (see
+    PypeLine.stream), it turns a stream of paths into a stream of records.
+
+    The sinks are their counterparts. They pass every record on unchanged,
+    but collect them, and write them in chunks of (at least) chunk_bytes:
+
+        * RecordSink, LineSink and NpySink
+
+    The file is created with the first chunk. When streamed, a sink writes
+    all remaining records at the end of the stream. Otherwise, call close
+    (or use it as a context manager). A sink, that is used again after
+    close, appends to its file.
+
+    >>> import os, tempfile
+    >>> from pypes.pypes import PypeLine
+    >>> path = os.path.join(tempfile.mkdtemp(), 'lines.txt')
+    >>> with LineSink(path, name='doc-sink') as sink:
+    ...     for line in ['one', 'two', 'three']:
+    ...         _ = sink.process(line)
+    >>> pype = PypeLine([LineSource(name='doc-lines')], name='doc-files')
+    >>> list(pype.stream([path]))
+    [20] - PypeLine.doc-files - starting up
+    [25] - PypeLine.doc-files - 3 outputs were produced.
+    ['one', 'two', 'three']
+    >>> list(LineSink(path, name='doc-sink').stream(['four']))
+    ['four']
+    >>> list(LineSource(name='doc-lines').records(path))
+    ['four']
+    >>> sink = LineSink(path, name='doc-sink')
+    >>> list(sink.stream(['five'])) + list(sink.stream(['six']))
+    ['five', 'six']
+    >>> list(LineSource(name='doc-lines').records(path))
+    ['five', 'six']
+"""
+
+from .pypes import PypeSegment
+from .pypes import as_next_input
+
+import os
+import mmap
+import struct
+from abc import ABCMeta
+from abc import abstractmethod
+from contextlib import contextmanager
+
+try:
+    import numpy
+    import numpy.lib.format
+except ImportError:
+    numpy = None
+
+
+@contextmanager
+def mapped(path):
+    """ Map the file at path read-only (None, if it is empty). """
+    with open(path, 'rb') as source:
+        try:
+            mapping = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # empty files can not be mapped
+            mapping = None
+        try:
+            yield mapping
+        finally:
+            if mapping is not None:
+                mapping.close()
+
+
+# a PypeSegment, that can have abstract methods (in python 2 and 3 syntax)
+AbstractSegment = ABCMeta('AbstractSegment', (PypeSegment,), {})
+
+
+class MappedSource(AbstractSegment):
+
+    """ Base class of the sources: map a path to an iterator of records.
+
+        >>> MappedSource() # doctest: +ELLIPSIS
+        Traceback (most recent call last):
+        ...
+        TypeError: Can't instantiate abstract class MappedSource...
+    """
+
+    @abstractmethod
+    def records(self, path):
+        """ Yield the records of the file at path. """
+
+    def process(self, path):
+        return self.records(path)
+
+    def process_stream(self, stream):
+        """ Yield the records of every path in stream. """
+        for data in stream:
+            data = as_next_input(data)
+            for record in self.records(*data.args, **data.kwd):
+                yield record
+
+
+class RecordSource(MappedSource):
+
+    """ Read fixed size binary records.
+
+        Give either the record_size in bytes (records are bytes), or a struct
+        format (records are unpacked into tuples). A trailing partial record
+        is ignored, with a warning.
+    """
+
+    record_size = None
+    format = None
+
+    def __init__(self, record_size=None, format=None, name=None):
+        if format is not None:
+            self.format = format
+        if record_size is not None:
+            self.record_size = record_size
+        if self.format is not None:
+            self.record_size = struct.calcsize(self.format)
+        if not self.record_size:
+            raise ValueError('a RecordSource needs a record_size or a struct format')
+        super(RecordSource, self).__init__(name)
+
+    def records(self, path):
+        unpack = struct.Struct(self.format).unpack_from if self.format else None
+        size = self.record_size
+
+        with mapped(path) as mapping:
+            if mapping is None:
+                return
+            end = len(mapping) - len(mapping) % size
+            if end != len(mapping):
+                self.log.warning('ignoring %s trailing bytes of %s', len(mapping) - end, path)
+            for offset in range(0, end, size):
+                if unpack is None:
+                    yield mapping[offset:offset + size]
+                else:
+                    yield unpack(mapping, offset)
+
+
+class LineSource(MappedSource):
+
+    """ Read the lines of a text file (without their line endings). """
+
+    encoding = 'utf-8'
+
+    def __init__(self, encoding=None, name=None):
+        if encoding is not None:
+            self.encoding = encoding
+        super(LineSource, self).__init__(name)
+
+    def records(self, path):
+        with mapped(path) as mapping:
+            if mapping is None:
+                return
+            for line in iter(mapping.readline, b''):
+                yield line.rstrip(b'\r\n').decode(self.encoding)
+
+
+class NpySource(MappedSource):
+
+    """ Load .npy files memory-mapped.
+
+        Processing a path returns the whole (memory-mapped) array. Streamed,
+        the rows are yielded in chunks of chunk_rows rows (views of the
+        mapping), or one by one, if chunk_rows is None.
+    """
+
+    mmap_mode = 'r'
+    chunk_rows = None
+
+    def __init__(self, chunk_rows=None, mmap_mode=None, name=None):
+        if numpy is None:
+            raise ImportError('the NpySource needs numpy to be installed')
+        if chunk_rows is not None:
+            self.chunk_rows = chunk_rows
+        if mmap_mode is not None:
+            self.mmap_mode = mmap_mode
+        super(NpySource, self).__init__(name)
+
+    def process(self, path):
+        return numpy.load(path, mmap_mode=self.mmap_mode)
+
+    def records(self, path):
+        array = self.process(path)
+        if self.chunk_rows is None:
+            for row in array:
+                yield row
+        else:
+            for start in range(0, len(array), self.chunk_rows):
+                yield array[start:start + self.chunk_rows]
+
+
+class ChunkedSink(AbstractSegment):
+
+    """ Base class of the sinks: collect records, and write them in chunks.
+
+        Subclasses define encode, which turns a record into bytes.
+    """
+
+    chunk_bytes = 1 << 20
+    mode = 'wb'
+    append_mode = 'ab'
+
+    def __init__(self, path, chunk_bytes=None, name=None):
+        self.path = path
+        if chunk_bytes is not None:
+            self.chunk_bytes = chunk_bytes
+        self.created = False
+        self.file = None
+        self.buffer = []
+        self.buffered = 0
+        super(ChunkedSink, self).__init__(name)
+
+    def __getstate__(self):
+        state = super(ChunkedSink, self).__getstate__()
+        state.update(file=None, buffer=[], buffered=0)
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @abstractmethod
+    def encode(self, record):
+        """ Turn record into bytes. """
+
+    def open(self):
+        """ Create the file at the first open, and append to it after (say, in the next stream). """
+        target = open(self.path, self.append_mode if self.created else self.mode)
+        self.created = True
+        return target
+
+    def process(self, record):
+        """ Collect record, and pass it on. """
+        chunk = self.encode(record)
+        self.buffer.append(chunk)
+        self.buffered += len(chunk)
+        if self.buffered >= self.chunk_bytes:
+            self.flush()
+        return record
+
+    def process_stream(self, stream):
+        """ Collect and pass on all records, and write the rest at the end. """
+        try:
+            for data in stream:
+                data = as_next_input(data)
+                yield self.process(*data.args, **data.kwd)
+        finally:
+            self.close()
+
+    def flush(self):
+        """ Write the collected records. """
+        if not self.buffer:
+            return
+        if self.file is None:
+            self.file = self.open()
+        self.file.write(b''.join(self.buffer))
+        self.buffer, self.buffered = [], 0
+
+    def close(self):
+        """ Write the collected records, and close the file. """
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class RecordSink(ChunkedSink):
+
+    """ Write fixed size binary records (bytes, or tuples packed with a struct format). """
+
+    format = None
+
+    def __init__(self, path, format=None, chunk_bytes=None, name=None):
+        if format is not None:
+            self.format = format
+        super(RecordSink, self).__init__(path, chunk_bytes, name)
+
+    def encode(self, record):
+        if self.format is None:
+            return bytes(record)
+        return struct.pack(self.format, *record)
+
+
+class LineSink(ChunkedSink):
+
+    """ Write records as lines of text. """
+
+    encoding = 'utf-8'
+
+    def __init__(self, path, encoding=None, chunk_bytes=None, name=None):
+        if encoding is not None:
+            self.encoding = encoding
+        super(LineSink, self).__init__(path, chunk_bytes, name)
+
+    def encode(self, record):
+        return u'{}\n'.format(record).encode(self.encoding)
+
+
+class NpySink(ChunkedSink):
+
+    """ Write arrays (rows, or chunks of rows) into one .npy file.
+
+        All records need the same dtype and row shape. Single rows must be
+        given as arrays of that shape, chunks have one more dimension. The
+        header is reserved up front, and rewritten with the final number
+        of rows on close.
+    """
+
+    header_bytes = 128
+    append_mode = 'r+b' # the header is rewritten on close
+
+    def __init__(self, path, dtype, row_shape=(), chunk_bytes=None, name=None):
+        if numpy is None:
+            raise ImportError('the NpySink needs numpy to be installed')
+        self.dtype = numpy.dtype(dtype)
+        self.row_shape = tuple(row_shape)
+        self.rows = 0
+        super(NpySink, self).__init__(path, chunk_bytes, name)
+
+    def header(self, rows):
+        """ A version 1.0 .npy header, padded to header_bytes. """
+        header = repr(dict(
+            descr=numpy.lib.format.dtype_to_descr(self.dtype),
+            fortran_order=False,
+            shape=(rows,) + self.row_shape,
+        ))
+        padding = self.header_bytes - 10 - len(header) - 1
+        if padding < 0:
+            raise ValueError('the dtype of {} is too complex for its header'.format(self))
+        header = (header + ' ' * padding + '\n').encode('latin1')
+        return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header
+
+    def open(self):
+        appending = self.created
+        target = super(NpySink, self).open()
+        if appending:
+            target.seek(0, os.SEEK_END)
+        else:
+            target.write(self.header(10 ** 18)) # reserve enough space for any shape
+        return target
+
+    def encode(self, record):
+        array = numpy.ascontiguousarray(record, dtype=self.dtype)
+        self.rows += 1 if array.shape == self.row_shape else len(array)
+        return array.tobytes()
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.seek(0)
+            self.file.write(self.header(self.rows))
+        super(NpySink, self).close()
@@ -0,0 +1,210 @@
+""" PypeGraphs: processing steps, that are not just a chain.
+
+    In a PypeGraph every segment is added under a key, and declares the keys
+    of the segments it needs the outputs of. Segments without such upstream
+    dependencies get the input of the graph. A segment with several upstream
+    segments (a join) gets their outputs merged into one NextInput: the args
+    are concatenated in the order the upstream keys were given, and the
+    keywords are merged.
+
+    Independent branches are processed concurrently in a thread pool, and
+    every output is computed only once, no matter how many segments use it.
+    The output of the graph is the (merged) output of the segments, that no
+    other segment depends on.
+
+    >>> graph = PypeGraph(name='graph-test', workers=1)
+    >>> graph.add('parse', PypeSegment('parse'))
+    >>> graph.add('left', PypeSegment('left'), after=['parse'])
+    >>> graph.add('right', PypeSegment('right'), after=['parse'])
+    >>> graph.add('join', PypeSegment('join'), after=['left', 'right'])
+    >>> graph.process('record')
+    [20] - PypeGraph.graph-test - starting up
+    [20] - PypeGraph.graph-test - PypeSegment.parse says input is ok
+    [20] - PypeGraph.graph-test - PypeSegment.parse is done
+    [20] - PypeGraph.graph-test - PypeSegment.left says input is ok
+    [20] - PypeGraph.graph-test - PypeSegment.left is done
+    [20] - PypeGraph.graph-test - PypeSegment.right says input is ok
+    [20] - PypeGraph.graph-test - PypeSegment.right is done
+    [20] - PypeGraph.graph-test - PypeSegment.join says input is ok
+    [20] - PypeGraph.graph-test - PypeSegment.join is done
+    [25] - PypeGraph.graph-test - output was produced.
+    NextInput(args=('record', 'record'), kwd={})
+"""
+
+from .pypes import NextInput
+from .pypes import PypeSegment
+from .pypes import PypeLine
+from .pypes import as_next_input
+
+from collections import namedtuple
+from collections import OrderedDict
+
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import wait
+
+
+PypeNode = namedtuple('PypeNode', ['segment', 'after'])
+
+def merge_inputs(outputs):
+    """ Merge the outputs of several segments into one input.
+
+        >>> merge_inputs(['a'])
+        'a'
+        >>> merge_inputs(['a', NextInput(('b',), {'c': 'd'})])
+        NextInput(args=['a', 'b'], kwd={'c': 'd'})
+    """
+    if len(outputs) == 1:
+        return outputs[0]
+
+    args, kwd = [], {}
+    for data in map(as_next_input, outputs):
+        args.extend(data.args)
+        kwd.update(data.kwd)
+    return NextInput(args, kwd)
+
+
+class PypeGraph(PypeLine):
+
+    """ A directed acyclic graph of (reusable) processing steps.
+
+        The segments attribute lists the segments in the order they were
+        added, which is always a valid (sequential) processing order.
+        Streaming and batch processing fall back to processing the records
+        one by one through process.
+    """
+
+    workers = None
+
+    def __init__(self, nodes=None, name=None, continue_on_errors=None, workers=None):
+        """ nodes may be an iterable of (key, segment, after) tuples. """
+        super(PypeGraph, self).__init__(None, name, continue_on_errors)
+        self.nodes = OrderedDict()
+        if workers is not None:
+            self.workers = workers
+        for node in nodes or ():
+            self.add(*node)
+
+    def add(self, key, segment, after=()):
+        """ Add segment as key, processing the outputs of the keys in after.
+
+            >>> PypeGraph(name='graph-add').add('join', PypeSegment(), after=['missing'])
+            Traceback (most recent call last):
+            ...
+            KeyError: "join depends on unknown segments: ['missing']"
+        """
+        if key in self.nodes:
+            raise KeyError('duplicate segment key: {!r}'.format(key))
+        unknown = [parent for parent in after if parent not in self.nodes]
+        if unknown:
+            raise KeyError('{} depends on unknown segments: {!r}'.format(key, unknown))
+
+        self.nodes[key] = PypeNode(segment, tuple(after))
+        self.segments.append(segment)
+
+    def roots(self):
+        """ The keys of the segments, that get the input of the graph. """
+        return [key for key, node in self.nodes.items() if not node.after]
+
+    def sinks(self):
+        """ The keys of the segments, that produce the output of the graph. """
+        used = set(parent for node in self.nodes.values() for parent in node.after)
+        return [key for key in self.nodes if key not in used]
+
+    def check_inputs(self, previous=None, *args, **kwd):
+        """ Pass the check_inputs call to the root segments. """
+        for key in self.roots():
+            self.nodes[key].segment.check_inputs(previous, *args, **kwd)
+
+    def _process_node(self, key, data):
+        """ Check and process the inputs of one node. """
+        segment, after = self.nodes[key]
+        previous = tuple(self.nodes[parent].segment for parent in after)
+        previous = previous[0] if len(previous) == 1 else previous or None
+
+        data = as_next_input(data)
+        self.log.debug('next input: %s', self._loggable(data))
+
+        try:
+            segment.check_inputs(previous, *data.args, **data.kwd)
+            self.log.info('%s says input is ok', segment)
+
+            data = segment.process(*data.args, **data.kwd)
+            self.log.info('%s is done', segment)
+
+        except Exception:
+            self._segment_failed(segment, data)
+
+        return data
+
+    def _node_input(self, key, source, results):
+        after = self.nodes[key].after
+        if not after:
+            return source
+        return merge_inputs([results[parent] for parent in after])
+
+    def process(self, *args, **kwd):
+        """ Process inputs and deliver an output. """
+
+        self.log.info('starting up')
+
+        source = NextInput(args, kwd)
+        results = {}
+
+        if self.workers == 1:
+            for key in self.nodes:
+                results[key] = self._process_node(key, self._node_input(key, source, results))
+        else:
+            self._process_concurrently(source, results)
+
+        data = merge_inputs([results[key] for key in self.sinks()]) if results else source
+
+        self.log.success('output was produced.')
+        self.log.debug('output was %r', self._loggable(data))
+
+        return data
+
+    def _process_concurrently(self, source, results):
+        """ Submit every node to a thread pool, as soon as its inputs are ready. """
+        waiting = list(self.nodes)
+        running = {}
+
+        with ThreadPoolExecutor(self.workers) as pool:
+            while waiting or running:
+
+                ready = [
+                    key for key in waiting
+                    if all(parent in results for parent in self.nodes[key].after)
+                ]
+                for key in ready:
+                    waiting.remove(key)
+                    data = self._node_input(key, source, results)
+                    running[pool.submit(self._process_node, key, data)] = key
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = running.pop(future)
+                    try:
+                        results[key] = future.result()
+                    except Exception:
+                        for pending in running:
+                            pending.cancel()
+                        raise
+
+    def process_stream(self, stream):
+        """ Process the records of stream one by one. """
+        return PypeSegment.process_stream(self, stream)
+
+    def process_batch(self, batch):
+        """ Process the records of batch one by one. """
+        return PypeSegment.process_batch(self, batch)
+
+    def pipelined(self, iterable, executor='thread', queue_size=1):
+        """ Not supported, since the segments are not a chain.
+
+            >>> PypeGraph(name='graph-stages').pipelined(['record'])
+            Traceback (most recent call last):
+            ...
+            TypeError: PypeGraph.graph-stages can not be pipelined, since its segments are not a chain
+        """
+        raise TypeError('{} can not be pipelined, since its segments are not a chain'.format(self))
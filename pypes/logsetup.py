@@ -10,6 +10,25 @@
             if such a variable is defined,
             a filelogger for that level is created
             and added to the logging facility
+        <LEVELNAME>_JSONLOG:
+            like <LEVELNAME>_LOGFILE, but the records are written as JSON
+            objects, one per line (see JsonLinesFormatter)
+        ASYNC_LOGGING:
+            if set (to anything but 0/no/false/off), loggers only put their
+            records into a queue, and a background thread writes them to
+            stdout and the logfiles (python 3 only)
+        MULTIPROCESS_LOGGING:
+            if set, worker processes started by the pypes runners send their
+            records to the parent process, which alone writes the logfiles
+            (see start_log_server)
+        LOG_SAMPLE_EVERY, LOG_RATE_LIMIT, LOG_SUMMARY_INTERVAL:
+            sample the records of all loggers: let only 1 in N records, or
+            at most K records per second pass (per message template), and
+            log how many were suppressed every so many seconds
+            (see SamplingFilter)
+
+        LOGLEVEL, STDOUT_LOGLEVEL and the logfiles are read once, when the
+        first logger is set up. Call reload_logconfig after changing them.
 
         If you run your_program.py like this:
 
@@ -24,7 +43,7 @@
         formatting large data structures (say on loglevel DEBUG), by setting
         the general loglevel (when not debugging) to some higher level.
 
-        Importing this module will also add a new level name: SUCCESS [25]
+        Setting up the first logger will also add a new level name: SUCCESS [25]
         The numeric values of that level and "it's neighbours" will then be:
         ...
         10 - DEBUG
@@ -45,11 +64,23 @@
 """
 import os
 import sys
+import time
+import binascii
+import atexit
 import logging
 from functools import partial
 
+import threading
+
+try:
+    from reprlib import Repr
+except ImportError: # python 2
+    from repr import Repr
+
+# logging.handlers, queue and multiprocessing are only imported, when the
+# modes that need them are used, to keep importing this module cheap
+
 SUCCESS = 25
-logging.addLevelName(SUCCESS, 'SUCCESS')
 
 PYTHON_3 = sys.version_info[0] == 3
 
@@ -58,6 +89,20 @@ if PYTHON_3:
 else:
     levelnames = logging._levelNames # pylint: disable=E1101
 
+installed = False
+
+def install():
+    """ Add the SUCCESS level and the fork hook to the logging module.
+
+        This is done when the first logger is set up, not on import.
+    """
+    global installed
+    if not installed:
+        installed = True
+        logging.addLevelName(SUCCESS, 'SUCCESS')
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=_after_fork_in_child)
+
 
 def get_logconfig(level=None):
     """ Get logging configuration from environment.
@@ -79,6 +124,7 @@ def get_logconfig(level=None):
         >>> get_logconfig()
         (20, 20, {})
     """
+    install()
 
     if level is None:
         level = os.environ.get('LOGLEVEL')
@@ -111,6 +157,82 @@ def get_logconfig(level=None):
 
     return level, stdout_loglevel, files
 
+def get_json_logfiles():
+    """ The JSON-lines logfiles from the environment, by level name.
+
+        >>> os.environ['ERROR_JSONLOG'] = 'errors.jsonl'
+        >>> get_json_logfiles()
+        {'ERROR': 'errors.jsonl'}
+        >>> del os.environ['ERROR_JSONLOG']
+    """
+    install()
+    files = {}
+    for levelname in levelnames:
+        if levelname == str(levelname):
+            env_varname = levelname.upper() + '_JSONLOG'
+            if env_varname in os.environ:
+                files[levelname] = os.environ[env_varname]
+    return files
+
+
+class LogConfig(object):
+
+    """ The logging configuration, read from the environment once.
+
+        Unpacks like the result of get_logconfig:
+
+        >>> level, stdout_level, files = LogConfig()
+        >>> level
+        20
+    """
+
+    def __init__(self, level=None):
+        self.level, self.stdout_level, self.files = get_logconfig(level)
+        self.json_files = get_json_logfiles()
+        self.sample_every = int(os.environ.get('LOG_SAMPLE_EVERY', 0)) or None
+        self.rate_limit = float(os.environ.get('LOG_RATE_LIMIT', 0)) or None
+        self.summary_interval = float(os.environ.get('LOG_SUMMARY_INTERVAL', 60))
+
+    def __iter__(self):
+        return iter((self.level, self.stdout_level, self.files))
+
+    def __repr__(self):
+        return 'LogConfig(level={}, stdout_level={}, files={!r})'.format(*self)
+
+logconfig = None
+
+def get_config():
+    """ The shared LogConfig (read from the environment on first use). """
+    global logconfig
+    if logconfig is None:
+        logconfig = LogConfig()
+    return logconfig
+
+def reload_logconfig():
+    """ Read the environment again, and apply it to all loggers set up so far.
+
+        The logfiles are closed and opened again, so this can also be
+        used to reopen them after they were rotated.
+
+        >>> reload_logconfig().level
+        20
+    """
+    global logconfig
+
+    logconfig = LogConfig()
+    stop_log_listener()
+    for handler in file_sinks.values():
+        handler.close()
+    file_sinks.clear()
+    del shared_sinks[:]
+
+    for name, logger in loggers.items():
+        logger.setLevel(logconfig.level)
+        if name not in sampled_loggers:
+            set_sampling(logger, logconfig.sample_every, logconfig.rate_limit, logconfig.summary_interval)
+    reset_handlers()
+    return logconfig
+
 reset_color = '\033[0m'
 termcolors = dict(
     off=reset_color,
@@ -184,14 +306,572 @@ def file_log_format(name):
     ])
     return fmt
 
+def env_flag(varname):
+    """ Tell if the environment variable is set to a true value.
+
+        >>> import os
+        >>> os.environ['ASYNC_LOGGING'] = 'off'
+        >>> env_flag('ASYNC_LOGGING')
+        False
+        >>> os.environ['ASYNC_LOGGING'] = '1'
+        >>> env_flag('ASYNC_LOGGING')
+        True
+        >>> del os.environ['ASYNC_LOGGING']
+    """
+    value = os.environ.get(varname, '').strip().lower()
+    return value not in ('', '0', 'no', 'false', 'off')
+
+
+class CappedRepr(Repr):
+
+    """ A reprlib.Repr, that does not build the full repr of large buffers. """
+
+    def repr_bytes(self, obj, level):
+        return self.repr_instance(obj[:self.maxother], level)
+
+    repr_bytearray = repr_bytes
+
+
+class ShortRepr(object):
+
+    """ Log an object with a size-capped repr.
+
+        The repr is built (and capped) only when the message is formatted,
+        and containers are abbreviated on the way (with reprlib), so no
+        full repr of a huge object is built.
+
+        >>> '%r' % ShortRepr(list(range(1000)), limit=40)
+        '[0, 1, 2, 3, 4, 5, ...]'
+        >>> from collections import namedtuple
+        >>> Point = namedtuple('Point', 'x y')
+        >>> '%s' % ShortRepr(Point('x' * 100, 1), limit=30)
+        "Point(x='xxxxxxxxxxxx...xxx..."
+        >>> len('%s' % ShortRepr([bytearray(10 ** 8)], limit=30))
+        30
+    """
+
+    __slots__ = ('obj', 'limit')
+
+    def __init__(self, obj, limit=1000):
+        self.obj = obj
+        self.limit = limit
+
+    def __repr__(self):
+        shortener = CappedRepr()
+        shortener.maxstring = shortener.maxother = self.limit
+        obj = self.obj
+        if isinstance(obj, tuple) and hasattr(obj, '_fields'):
+            # reprlib would build the full repr of namedtuples (like NextInput)
+            text = '{}({})'.format(type(obj).__name__, ', '.join(
+                '{}={}'.format(field, shortener.repr(value))
+                for field, value in zip(obj._fields, obj)
+            ))
+        else:
+            text = shortener.repr(obj)
+        if len(text) > self.limit:
+            text = text[:self.limit - 3] + '...'
+        return text
+
+    __str__ = __repr__
+
+
+class JsonLinesFormatter(logging.Formatter):
+
+    """ Format records as compact JSON objects (for one per line).
+
+        Every record has a time, level, logger and message. The PypeLine
+        runners add the fields event (start, ok, done, fail or end),
+        segment and duration (in seconds) to their records, which are then
+        written along with the pipeline (the logger of the event).
+        Failures come with the formatted exception.
+
+        >>> record = logging.makeLogRecord(dict(
+        ...     name='PypeLine.json', levelno=20, levelname='INFO', created=0.5,
+        ...     msg='%s is done', args=('PypeSegment.one',),
+        ...     event='done', segment='PypeSegment.one', duration=0.25,
+        ... ))
+        >>> print(JsonLinesFormatter().format(record))
+        {"time":0.5,"level":"INFO","logger":"PypeLine.json","message":"PypeSegment.one is done","event":"done","pipeline":"PypeLine.json","segment":"PypeSegment.one","duration":0.25}
+    """
+
+    def __init__(self):
+        super(JsonLinesFormatter, self).__init__()
+        import json
+        self.encode = json.JSONEncoder(separators=(',', ':'), default=str).encode
+
+    def format(self, record):
+        entry = {
+            'time': record.created,
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+
+        event = getattr(record, 'event', None)
+        if event is not None:
+            entry['event'] = event
+            entry['pipeline'] = record.name
+            segment = getattr(record, 'segment', None)
+            if segment is not None:
+                entry['segment'] = segment
+            duration = getattr(record, 'duration', None)
+            if duration is not None:
+                entry['duration'] = duration
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+
+        return self.encode(entry)
+
+
+file_sinks = {}
+
+def get_json_sink(levelname, filename):
+    """ The handler of a JSON-lines logfile, shared by all loggers. """
+    key = 'json', levelname, filename
+    if key not in file_sinks:
+        handler = logging.FileHandler(filename, encoding='utf-8')
+        handler.setLevel(levelname)
+        handler.setFormatter(JsonLinesFormatter())
+        file_sinks[key] = handler
+    return file_sinks[key]
+
+def get_file_sink(levelname, filename):
+    """ The handler of a logfile, shared by all loggers.
+
+        The records are formatted with the name of the logger they came from.
+    """
+    key = levelname, filename
+    if key not in file_sinks:
+        handler = logging.FileHandler(filename, encoding='utf-8')
+        handler.setLevel(levelname)
+        handler.setFormatter(logging.Formatter(file_log_format('%(name)s')))
+        file_sinks[key] = handler
+    return file_sinks[key]
+
+def make_sink_handlers(name, stdout_level, files):
+    """ Create the handler, that writes to stdout, and add the shared logfile handlers. """
+
+    stdout_handler = logging.StreamHandler(sys.stdout)
+    stdout_handler.setLevel(stdout_level)
+    stdout_format = stdout_log_format(name)
+    readable_formatter = logging.Formatter(stdout_format)
+    stdout_handler.setFormatter(readable_formatter)
+    handlers = [stdout_handler]
+
+    for levelname, filename in files.items():
+        handlers.append(get_file_sink(levelname, filename))
+
+    for levelname, filename in get_config().json_files.items():
+        handlers.append(get_json_sink(levelname, filename))
+
+    return handlers
+
+shared_sinks = []
+
+def get_shared_sinks():
+    """ The sink handlers shared by all loggers, which therefore
+        format the logger name from the record.
+    """
+    if not shared_sinks:
+        level, stdout_level, files = get_config()
+        shared_sinks.extend(make_sink_handlers('%(name)s', stdout_level, files))
+    return shared_sinks
+
+def dispatch_to_sinks(record):
+    """ Handle record with every shared sink, that accepts its level. """
+    for handler in get_shared_sinks():
+        if record.levelno >= handler.level:
+            handler.handle(record)
+
+log_queue = None
+log_listener = None
+
+def start_log_listener():
+    """ Start the background thread, that owns all sink handlers.
+
+        Returns the queue to put records into.
+    """
+    global log_queue, log_listener
+
+    if log_listener is None:
+        from logging.handlers import QueueListener
+        try:
+            import queue
+        except ImportError: # python 2
+            import Queue as queue
+        log_queue = queue.Queue(-1)
+        log_listener = QueueListener(log_queue, *get_shared_sinks(), respect_handler_level=True)
+        log_listener.start()
+        atexit.register(stop_log_listener)
+
+    return log_queue
+
+def stop_log_listener():
+    """ Write all queued records, and stop the background thread. """
+    global log_queue, log_listener
+
+    if log_listener is not None:
+        log_listener.stop()
+        log_queue = log_listener = None
+
+
+queue_handler_type = None
+
+def make_queue_handler(queue):
+    """ A QueueHandler, that keeps the exception apart from the message.
+
+        The standard QueueHandler folds the traceback into the message,
+        so the JSON sinks could not write it as a field of its own.
+
+        >>> import sys, queue
+        >>> records = queue.Queue()
+        >>> try:
+        ...     1 / 0
+        ... except ZeroDivisionError:
+        ...     record = logging.makeLogRecord(dict(msg='%s failed', args=('it',), exc_info=sys.exc_info()))
+        >>> make_queue_handler(records).handle(record)
+        True
+        >>> queued = records.get()
+        >>> queued.getMessage(), queued.exc_info, queued.exc_text.splitlines()[-1]
+        ('it failed', None, 'ZeroDivisionError: division by zero')
+    """
+    global queue_handler_type
+
+    if queue_handler_type is None:
+        import copy
+        from logging.handlers import QueueHandler
+
+        class RecordQueueHandler(QueueHandler):
+
+            def prepare(self, record):
+                """ Format the message and the exception, so the record can be pickled. """
+                record = copy.copy(record)
+                if record.exc_info and not record.exc_text:
+                    record.exc_text = (self.formatter or logging.Formatter()).formatException(record.exc_info)
+                record.message = record.msg = record.getMessage()
+                record.args = record.exc_info = None
+                return record
+
+        queue_handler_type = RecordQueueHandler
+
+    return queue_handler_type(queue)
+
+
+LOG_SOCKET_VARNAME = 'PYPES_LOG_SOCKET'
+LOG_AUTHKEY_VARNAME = 'PYPES_LOG_AUTHKEY'
+
+def make_log_server(authkey):
+    """ A server, that dispatches the records sent by the ForwardingHandlers
+        of worker processes to the shared sinks.
+
+        Clients must authenticate with authkey, before any of their data
+        is unpickled (see multiprocessing.connection).
+    """
+    from multiprocessing.connection import Listener
+
+    class LogRecordServer(object):
+
+        def __init__(self):
+            self.listener = Listener(('127.0.0.1', 0), authkey=authkey)
+            self.server_address = self.listener.address
+
+        def serve_forever(self):
+            listener = self.listener
+            while self.listener is not None:
+                try:
+                    connection = listener.accept()
+                except Exception: # failed to authenticate (or closed)
+                    continue
+                if self.listener is None:
+                    connection.close()
+                    break
+                receiver = threading.Thread(target=self.receive, args=(connection,))
+                receiver.daemon = True
+                receiver.start()
+            listener.close()
+
+        def receive(self, connection):
+            try:
+                while True:
+                    record = connection.recv()
+                    dispatch_to_sinks(logging.makeLogRecord(record))
+            except (EOFError, OSError, IOError):
+                pass
+            finally:
+                connection.close()
+
+        def shutdown(self):
+            """ Stop accepting connections (waking up the pending accept). """
+            import socket
+            self.listener = None
+            try:
+                socket.create_connection(self.server_address, timeout=1).close()
+            except (OSError, IOError):
+                pass
+
+        def server_close(self):
+            pass
+
+    return LogRecordServer()
+
+def make_forwarding_handler(address, authkey):
+    """ A handler, that sends the records to the log server at address. """
+    from multiprocessing.connection import Client
+
+    class ForwardingHandler(logging.Handler):
+
+        def __init__(self):
+            super(ForwardingHandler, self).__init__()
+            self.connection = None
+
+        def emit(self, record):
+            try:
+                if self.connection is None:
+                    self.connection = Client(address, authkey=authkey)
+                self.connection.send(self.prepare(record))
+            except Exception:
+                self.connection = None
+                self.handleError(record)
+
+        def prepare(self, record):
+            """ The attributes of record, with the message and exception formatted. """
+            if record.exc_info and not record.exc_text:
+                record.exc_text = (self.formatter or logging.Formatter()).formatException(record.exc_info)
+            attributes = dict(record.__dict__)
+            attributes.update(msg=record.getMessage(), args=None, exc_info=None)
+            attributes.pop('message', None)
+            return attributes
+
+        def close(self):
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+            super(ForwardingHandler, self).close()
+
+    return ForwardingHandler()
+
+log_server = None
+log_server_pid = None
+
+def start_log_server():
+    """ Start collecting the records of worker processes in this process.
+
+        The address of the server is exported as PYPES_LOG_SOCKET, so all
+        child processes (forked or spawned) send their records there, and
+        this process writes them to stdout and the logfiles. So there is
+        only one file handle per logfile, and lines do not interleave.
+        The existing loggers of this process switch to the shared sinks.
+        The children authenticate with a random key, exported (hex encoded)
+        as PYPES_LOG_AUTHKEY, so no other local user can send records
+        (which are pickled) to this process.
+
+        >>> address = start_log_server()
+        >>> os.environ['PYPES_LOG_SOCKET'] == address
+        True
+        >>> forwarding_address() is None
+        True
+        >>> stop_log_server()
+    """
+    global log_server, log_server_pid
+
+    if log_server is None:
+        authkey = os.urandom(32)
+        log_server = make_log_server(authkey)
+        log_server_pid = os.getpid()
+        thread = threading.Thread(target=log_server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        os.environ[LOG_SOCKET_VARNAME] = '{}:{}'.format(*log_server.server_address)
+        os.environ[LOG_AUTHKEY_VARNAME] = binascii.hexlify(authkey).decode('ascii')
+        atexit.register(stop_log_server)
+        reset_handlers()
+
+    return os.environ[LOG_SOCKET_VARNAME]
+
+def stop_log_server():
+    """ Stop collecting the records of worker processes. """
+    global log_server, log_server_pid
+
+    if log_server is not None:
+        log_server.shutdown()
+        log_server.server_close()
+        log_server = log_server_pid = None
+        os.environ.pop(LOG_SOCKET_VARNAME, None)
+        os.environ.pop(LOG_AUTHKEY_VARNAME, None)
+        reset_handlers()
+
+def forwarding_address():
+    """ The (host, port) to send records to, if this is a worker process. """
+    address = os.environ.get(LOG_SOCKET_VARNAME)
+    if address is None or os.getpid() == log_server_pid:
+        return None
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+def forwarding_authkey():
+    return binascii.unhexlify(os.environ.get(LOG_AUTHKEY_VARNAME, ''))
+
+def make_handlers(name, stdout_level, files):
+    """ Choose the handlers for a new logger, depending on the mode. """
+
+    address = forwarding_address()
+    if address is not None:
+        return [make_forwarding_handler(address, forwarding_authkey())]
+
+    if PYTHON_3 and env_flag('ASYNC_LOGGING'):
+        return [make_queue_handler(start_log_listener())]
+
+    if log_server is not None:
+        return list(get_shared_sinks())
+
+    return make_sink_handlers(name, stdout_level, files)
+
+def reset_handlers():
+    """ Replace the handlers of all loggers set up so far. """
+    level, stdout_level, files = get_config()
+    for name, logger in loggers.items():
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        for handler in make_handlers(name, stdout_level, files):
+            logger.addHandler(handler)
+
+def _after_fork_in_child():
+    """ A forked child has neither the listener thread, nor the server. """
+    global log_queue, log_listener, log_server
+    if log_listener is not None or forwarding_address() is not None:
+        log_queue = log_listener = log_server = None
+        reset_handlers()
+
+class SamplingFilter(logging.Filter):
+
+    """ Let only some of the records below ERROR pass, per message template.
+
+        With every, 1 in every records of a template passes (the first one,
+        and so on). With rate, records of a template pass at that many per
+        second, on average (a token bucket, that holds at least one record).
+        Records of level ERROR and above always pass.
+
+        >>> sampler = SamplingFilter(every=3)
+        >>> records = [logging.makeLogRecord(dict(msg='%s is done', levelno=20)) for _ in range(6)]
+        >>> [sampler.filter(record) for record in records]
+        [True, False, False, True, False, False]
+        >>> sampler.filter(logging.makeLogRecord(dict(msg='%s is done', levelno=40)))
+        True
+
+        >>> sampler = SamplingFilter(rate=0.5)
+        >>> records = [logging.makeLogRecord(dict(msg='tick', levelno=20, created=second)) for second in [0, 0.5, 1, 2, 3, 4]]
+        >>> [sampler.filter(record) for record in records]
+        [True, False, False, True, False, True]
+
+        At most max_templates templates are told apart, all further ones
+        (say, messages formatted before logging) are sampled as one:
+
+        >>> sampler = SamplingFilter(every=10)
+        >>> passed = [sampler.filter(logging.makeLogRecord(dict(msg='got %r' % number, levelno=20))) for number in range(2000)]
+        >>> len(sampler.seen), sum(passed)
+        (1001, 1100)
+
+        The counts of suppressed records are logged through logger every
+        interval seconds (checked when records arrive), and on exit. Then
+        all counts are reset.
+    """
+
+    max_templates = 1000
+    other_templates = '(other messages)'
+
+    def __init__(self, every=None, rate=None, interval=60.0, logger=None):
+        super(SamplingFilter, self).__init__()
+        self.every = every
+        self.rate = rate
+        self.burst = max(rate or 0, 1)
+        self.interval = interval
+        self.logger = logger
+        self.seen = {}
+        self.buckets = {}
+        self.suppressed = {}
+        self.last_summary = time.time()
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR or getattr(record, 'sampling_summary', False):
+            return True
+
+        template = record.msg if isinstance(record.msg, str) else repr(type(record.msg))
+        with self.lock:
+            tracked = self.seen if self.every else self.buckets
+            if template not in tracked and len(tracked) >= self.max_templates:
+                template = self.other_templates
+
+            passed = True
+            if self.every:
+                seen = self.seen.get(template, 0)
+                self.seen[template] = seen + 1
+                passed = seen % self.every == 0
+            if passed and self.rate:
+                tokens, last = self.buckets.get(template, (self.burst, record.created))
+                tokens = min(self.burst, tokens + (record.created - last) * self.rate)
+                passed = tokens >= 1
+                self.buckets[template] = tokens - passed, record.created
+            if not passed:
+                count, levelno = self.suppressed.get(template, (0, 0))
+                self.suppressed[template] = count + 1, max(levelno, record.levelno)
+            due = bool(self.suppressed) and record.created - self.last_summary >= self.interval
+
+        if due:
+            self.summarize()
+        return passed
+
+    def summarize(self):
+        """ Log the counts of the suppressed records, and reset all counts. """
+        with self.lock:
+            suppressed, self.suppressed = self.suppressed, {}
+            self.seen, self.buckets = {}, {}
+            self.last_summary = time.time()
+        if self.logger is None:
+            return
+        for template, (count, levelno) in sorted(suppressed.items()):
+            self.logger.log(
+                levelno, 'suppressed %d records like %r', count, template,
+                extra=dict(sampling_summary=True),
+            )
+
+def set_sampling(logger, every=None, rate=None, interval=None):
+    """ Replace the SamplingFilter of logger (without every and rate, just remove it).
+
+        Returns the new filter, if any.
+    """
+    for old in [f for f in logger.filters if isinstance(f, SamplingFilter)]:
+        logger.removeFilter(old)
+        old.summarize()
+        if hasattr(atexit, 'unregister'): # not on python 2
+            atexit.unregister(old.summarize)
+    if not (every or rate):
+        return None
+
+    if interval is None:
+        interval = get_config().summary_interval
+    sampler = SamplingFilter(every, rate, interval, logger)
+    logger.addFilter(sampler)
+    atexit.register(sampler.summarize)
+    return sampler
+
+# the loggers sampled through setup_logger, not the environment
+sampled_loggers = set()
+
 loggers = {}
 
-def setup_logger(name):
+def setup_logger(name, sample_every=None, rate_limit=None):
     """ Set up a custom logger with handlers for stdout and possibly some files.
         The name will be included in all it's log outputs.
 
         To prevent duplicate adding of handlers to already existing loggers,
         the set of created loggers is cached in the global loggers dict.
+        The configuration is read from the environment for the first logger,
+        and shared by all others (see reload_logconfig). So is the handler
+        of every logfile.
 
         >>> import os
         >>> os.environ['ERROR_LOGFILE'] = '/tmp/pypes_logging_test.log'
@@ -199,30 +879,52 @@ def setup_logger(name):
         >>> logger.success('Result invisible to doctest...')
         [25] - test - Result invisible to doctest...
 
+        With ASYNC_LOGGING, records are handed to a background thread:
+
+        >>> os.environ['ASYNC_LOGGING'] = 'yes'
+        >>> logger = setup_logger('async-test')
+        >>> logger.handlers
+        [<RecordQueueHandler (NOTSET)>]
+        >>> del os.environ['ASYNC_LOGGING']
+        >>> stop_log_listener()
+
+        With sample_every and/or rate_limit, only some records of the
+        logger are let through (see SamplingFilter), for example 1 in 3:
+
+        >>> logger = setup_logger('sampled-test', sample_every=3)
+        >>> for number in range(5):
+        ...     logger.info('record %d', number)
+        [20] - sampled-test - record 0
+        [20] - sampled-test - record 3
+        >>> logger.filters[0].summarize()
+        [20] - sampled-test - suppressed 3 records like 'record %d'
+
+        Loggers set up without them are sampled as configured by the
+        environment (LOG_SAMPLE_EVERY and LOG_RATE_LIMIT).
     """
     if name in loggers:
-        return loggers[name]
+        logger = loggers[name]
+        if sample_every or rate_limit:
+            set_sampling(logger, sample_every, rate_limit)
+            sampled_loggers.add(name)
+        return logger
 
-    level, stdout_level, files = get_logconfig()
+    config = get_config()
+    level, stdout_level, files = config
 
     logger = logging.getLogger(name)
     logger.setLevel(level)
 
-    stdout_handler = logging.StreamHandler(sys.stdout)
-    stdout_handler.setLevel(stdout_level)
-    stdout_format = stdout_log_format(name)
-    readable_formatter = logging.Formatter(stdout_format)
-    stdout_handler.setFormatter(readable_formatter)
-    logger.addHandler(stdout_handler)
-
-    if files:
-        logfile_formatter = logging.Formatter(file_log_format(name))
-        for levelname, filename in files.items():
-            handler = logging.FileHandler(filename, encoding='utf-8')
-            handler.setLevel(levelname)
-            handler.setFormatter(logfile_formatter)
-            logger.addHandler(handler)
+    for handler in make_handlers(name, stdout_level, files):
+        logger.addHandler(handler)
 
     logger.success = partial(logger.log, SUCCESS)
 
+    if sample_every or rate_limit:
+        sampled_loggers.add(name)
+    else:
+        sample_every, rate_limit = config.sample_every, config.rate_limit
+    if sample_every or rate_limit:
+        set_sampling(logger, sample_every, rate_limit, config.summary_interval)
+
     return loggers.setdefault(name, logger)
@@ -0,0 +1,274 @@
+""" Run a PypeSegment (or PypeLine) over many independent inputs in parallel.
+
+    The inputs are fanned out over a pool of worker processes (or threads),
+    each worker runs the complete segment on one input at a time, and the
+    outputs are collected either in input order, or as they complete.
+
+    Segments are shipped to the workers once per worker (not once per input).
+    Their loggers are not pickled, but set up again through setup_logger in
+    the worker, so logging keeps working there, configured by the same
+    environment variables.
+    With MULTIPROCESS_LOGGING set, the workers send their records to this
+    process, which then is the only one writing the logfiles.
+    With shared_memory, large buffers are not pickled, but handed over
+    through memory-mapped files (see pypes.sharedmem).
+
+    For many calls (say from a service, that handles requests), a WarmPool
+    keeps its worker processes alive. They are forked from this process
+    (where the start method allows), so the segment is constructed only
+    once, and its state (models, lookup tables, loggers) is shared
+    copy-on-write, instead of being pickled or set up again per worker.
+
+    >>> from pypes.pypes import PypeSegment
+    >>> list(pype_map(PypeSegment('map-test'), ['a', 'b'], workers=2))
+    [NextInput(args=('a',), kwd={}), NextInput(args=('b',), kwd={})]
+"""
+
+from .logsetup import env_flag
+from .logsetup import start_log_server
+from .pypes import NextInput
+from .pypes import as_next_input
+from .sharedmem import SharedMemoryArena
+
+import os
+import multiprocessing
+from collections import deque
+from functools import partial
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import wait
+
+executors = {
+    'process': ProcessPoolExecutor,
+    'thread': ThreadPoolExecutor,
+}
+
+_worker_segment = None
+
+def _install_segment(segment):
+    """ Initializer of the worker processes: remember the segment to run. """
+    global _worker_segment
+    _worker_segment = segment
+
+def _process_segment(segment, data, arena=None):
+    """ Process one input with segment.
+
+        With an arena, shared inputs are mapped, and large outputs shared.
+    """
+    if arena is None:
+        return segment.process(*data.args, **data.kwd)
+    data = arena.resolve(data)
+    return arena.share_output(segment.process(*data.args, **data.kwd))
+
+def _process_in_worker(data, arena=None):
+    """ Process one input with the segment installed in this worker process. """
+    return _process_segment(_worker_segment, data, arena)
+
+def _worker_pid():
+    return os.getpid()
+
+
+def make_executor(segment, workers=None, executor='process'):
+    """ Create an executor, whose workers know about segment.
+
+        executor can be one of the names in the executors dict. Threads
+        share the globals of this process, so only the worker processes
+        get the segment installed (threads are handed it with every input,
+        see pype_map).
+
+        >>> from pypes.pypes import PypeSegment
+        >>> make_executor(PypeSegment('noop'), executor='gpu')
+        Traceback (most recent call last):
+        ...
+        ValueError: unknown executor: 'gpu' (choose from: process, thread)
+    """
+    if executor not in executors:
+        msg = 'unknown executor: {!r} (choose from: {})'
+        raise ValueError(msg.format(executor, ', '.join(sorted(executors))))
+
+    if executor == 'thread':
+        return ThreadPoolExecutor(max_workers=workers)
+
+    return executors[executor](
+        max_workers=workers,
+        initializer=_install_segment,
+        initargs=(segment,),
+    )
+
+
+class WarmPool(object):
+
+    """ Long-lived worker processes, that serve the process calls of segment.
+
+        The workers are started right away, forked from this process if
+        possible, so construct the segment before the pool. Use the pool
+        as a context manager, or close it.
+
+        >>> from pypes.pypes import PypeSegment
+        >>> with WarmPool(PypeSegment('warm-test'), workers=2) as pool:
+        ...     pool.process('a')
+        ...     list(pool.map(['b', 'c']))
+        NextInput(args=('a',), kwd={})
+        [NextInput(args=('b',), kwd={}), NextInput(args=('c',), kwd={})]
+    """
+
+    def __init__(self, segment, workers=None, start_method=None):
+        if start_method is None and 'fork' in multiprocessing.get_all_start_methods():
+            start_method = 'fork'
+
+        if env_flag('MULTIPROCESS_LOGGING'):
+            start_log_server()
+
+        self.segment = segment
+        self.workers = workers or multiprocessing.cpu_count()
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context(start_method),
+            initializer=_install_segment,
+            initargs=(segment,),
+        )
+        self.warm_up()
+
+    def __str__(self):
+        return 'WarmPool of {} x {}'.format(self.workers, self.segment)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def warm_up(self):
+        """ Make sure, that all workers are started (and wait for them). """
+        wait([self.executor.submit(_worker_pid) for _ in range(self.workers)])
+
+    def submit(self, *args, **kwd):
+        """ Process the inputs in a worker, and return a Future of the output. """
+        return self.executor.submit(_process_in_worker, NextInput(args, kwd))
+
+    def process(self, *args, **kwd):
+        """ Process the inputs in a worker, and return the output. """
+        return self.submit(*args, **kwd).result()
+
+    __call__ = process
+
+    def map(self, inputs, ordered=True, shared_memory=False):
+        """ Process many inputs with the workers (see pype_map). """
+        return pype_map(self.segment, inputs, executor=self, ordered=ordered, shared_memory=shared_memory)
+
+    def close(self, wait=True):
+        """ Stop the workers. """
+        self.executor.shutdown(wait=wait)
+
+
+def pype_map(segment, inputs, workers=None, executor='process', ordered=True,
+             shared_memory=False):
+    """ Process all inputs with segment, distributed over workers.
+
+        Arguments:
+            inputs - an iterable of inputs, that may be wrapped
+                     through wrap_for_next_segment
+            workers - the number of workers (default: number of cpus)
+            executor - 'process', 'thread' or a WarmPool (which is not
+                       closed afterwards)
+            ordered - if False, outputs are yielded as soon as they
+                      are done, rather than in the order of inputs
+            shared_memory - True (or a SharedMemoryArena) to hand large
+                      buffers to the workers (and back) without pickling
+                      them; they arrive as read-only views
+
+        If the segment has continue_on_errors set, an input that could not
+        be processed is logged and passed on unchanged (just like failing
+        segments are skipped within a PypeLine). Else the first error is
+        raised, and pending inputs are cancelled.
+
+        This is a generator, so the processing starts with the first
+        output being requested. Only twice as many inputs as there are
+        workers are submitted ahead of the consumer, and the inputs, that
+        were not started yet, are cancelled when it stops early.
+    """
+    continue_on_errors = getattr(segment, 'continue_on_errors', False)
+
+    warm = isinstance(executor, WarmPool)
+    processes = warm or executor == 'process'
+
+    if processes and env_flag('MULTIPROCESS_LOGGING'):
+        start_log_server()
+
+    arena = None
+    if shared_memory and processes:
+        arena = shared_memory if isinstance(shared_memory, SharedMemoryArena) else SharedMemoryArena()
+
+    if warm:
+        pool, workers = executor.executor, executor.workers
+    else:
+        pool = make_executor(segment, workers, executor)
+        workers = workers or multiprocessing.cpu_count()
+
+    # threads can not tell their segment by the worker global (other maps share it)
+    task = _process_in_worker if processes else partial(_process_segment, segment)
+
+    # only a window of inputs is in flight, so the inputs are consumed lazily
+    inputs = iter(inputs)
+    window = 2 * workers
+    futures = {}
+    pending = deque()
+
+    def submit(count):
+        for data in islice(inputs, count):
+            data = as_next_input(data)
+            shared = data if arena is None else arena.share_input(data)
+            future = pool.submit(task, shared, arena)
+            futures[future] = data, shared
+            pending.append(future)
+
+    def finished():
+        """ Yield the futures in input order (or as they complete), and refill the window. """
+        submit(window)
+        while pending:
+            if ordered:
+                ready = [pending.popleft()]
+            else:
+                ready = wait(pending, return_when=FIRST_COMPLETED).done
+                for future in ready:
+                    pending.remove(future)
+            submit(len(ready))
+            for future in ready:
+                yield future
+
+    try:
+        for future in finished():
+            data, shared = futures.pop(future)
+            if arena is not None:
+                wait([future])
+                arena.discard(shared) # the worker is done with the input files
+            try:
+                output = future.result()
+                yield output if arena is None else arena.resolve(output, unlink=True)
+            except Exception:
+                if not continue_on_errors:
+                    segment.log.error(
+                        'could not process %r\n', segment._loggable(data),
+                        exc_info=True,
+                    )
+                    raise
+                segment.log.warning(
+                    'an input failed, but processing will continue.',
+                    exc_info=True,
+                )
+                yield data
+    finally:
+        # do not wait for the inputs, that were not started yet
+        started = [future for future in futures if not future.cancel()]
+        if not warm:
+            pool.shutdown()
+        if arena is not None:
+            # remove the shared in- and outputs, that the consumer did not get
+            wait(started)
+            for future, (data, shared) in futures.items():
+                arena.discard(shared)
+                if future in started and future.exception() is None:
+                    arena.discard(future.result())
+            arena.close()
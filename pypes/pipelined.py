@@ -0,0 +1,202 @@
+""" Run the segments of a PypeLine as overlapping stages.
+
+    Every segment runs in its own thread (or process) and pulls its inputs
+    from a bounded queue, that is fed by the previous segment. So while one
+    segment waits for I/O, the next one can already crunch the previous
+    record, and the throughput approaches that of the slowest stage.
+
+    The size of the queue in front of a segment can be set through its
+    queue_size attribute, else the queue_size given to pipelined is used.
+    A full queue blocks the stage feeding it (backpressure), so memory stays
+    bounded even if a fast stage is followed by a slow one.
+
+    At each stage boundary the segment checks its inputs, just like it does
+    in PypeLine.process. With continue_on_errors a failing record is passed
+    on unchanged, else the first error stops the whole line, and is raised
+    to the consumer of the outputs.
+
+    With MULTIPROCESS_LOGGING set, stage processes send their records to
+    this process, which then is the only one writing the logfiles.
+
+    >>> from pypes.pypes import PypeSegment, PypeLine
+    >>> pype = PypeLine([PypeSegment('noop'), PypeSegment('noop')], name='stages')
+    >>> outputs = list(pipelined(pype, ['a', 'b'])) # doctest: +ELLIPSIS
+    [20] - PypeLine.stages - starting up 2 stages
+    ...
+    [25] - PypeLine.stages - 2 outputs were produced.
+    >>> outputs
+    [NextInput(args=('a',), kwd={}), NextInput(args=('b',), kwd={})]
+
+    Errors of the input iterable are raised to the consumer, too:
+
+    >>> def broken():
+    ...     yield 'a'
+    ...     raise RuntimeError('broken input')
+    >>> list(pipelined(pype, broken()))
+    Traceback (most recent call last):
+    ...
+    RuntimeError: broken input
+"""
+
+from .logsetup import ShortRepr
+from .logsetup import env_flag
+from .logsetup import setup_logger
+from .logsetup import start_log_server
+from .pypes import as_next_input
+
+from collections import namedtuple
+
+import threading
+import multiprocessing
+
+try:
+    import queue
+except ImportError: # python 2
+    import Queue as queue
+
+
+StageFailure = namedtuple('StageFailure', ['segment', 'exception'])
+
+class EndOfStream(object):
+    """ Marks the end of the records in a stage queue. """
+
+END = EndOfStream
+
+backends = {
+    'thread': (threading.Thread, queue.Queue, threading.Event),
+    'process': (multiprocessing.Process, multiprocessing.Queue, multiprocessing.Event),
+}
+
+
+def _run_stage(line_name, continue_on_errors, segment, previous, inbox, outbox, stop, repr_limit=None):
+    """ Process the records from inbox, and put the outputs into outbox.
+
+        With a repr_limit, failing records are logged with a capped repr.
+    """
+    log = setup_logger(line_name)
+
+    while True:
+        data = inbox.get()
+
+        if data is END:
+            break
+        elif stop.is_set() or isinstance(data, StageFailure):
+            outbox.put(data)
+            continue
+
+        data = as_next_input(data)
+        log.debug('next input: %s', data)
+        try:
+            segment.check_inputs(previous, *data.args, **data.kwd)
+            log.info('%s says input is ok', segment)
+            data = segment.process(*data.args, **data.kwd)
+            log.info('%s is done', segment)
+        except Exception as ex:
+            if continue_on_errors:
+                log.warning(
+                    '%s failed, but processing will continue.', segment,
+                    exc_info=True,
+                )
+            else:
+                log.error(
+                    '%s could not process %r\n', segment,
+                    data if repr_limit is None else ShortRepr(data, repr_limit),
+                    exc_info=True,
+                )
+                data = StageFailure(str(segment), ex)
+
+        outbox.put(data)
+
+    outbox.put(END)
+
+
+def _feed(iterable, outbox, stop):
+    """ Put the records of iterable into the first stage queue.
+
+        If iterable raises, the error is passed down the stages (and
+        raised to the consumer), just like the failure of a stage.
+    """
+    try:
+        for data in iterable:
+            if stop.is_set():
+                break
+            outbox.put(data)
+    except Exception as ex:
+        outbox.put(StageFailure('the input', ex))
+    outbox.put(END)
+
+
+def pipelined(line, iterable, executor='thread', queue_size=1):
+    """ Stream the records of iterable through the stages of line.
+
+        Arguments:
+            line - a PypeLine, whose segments will become the stages
+            iterable - the input records
+            executor - 'thread' or 'process'
+            queue_size - default size of the queues between the stages
+                         (segments may override it by a queue_size attribute)
+
+        Returns a generator of the outputs, in the order of the inputs.
+        The stages are started, when the first output is requested.
+    """
+    if executor not in backends:
+        msg = 'unknown executor: {!r} (choose from: {})'
+        raise ValueError(msg.format(executor, ', '.join(sorted(backends))))
+
+    worker_type, queue_type, event_type = backends[executor]
+    if executor == 'process' and env_flag('MULTIPROCESS_LOGGING'):
+        start_log_server()
+
+    continue_on_errors = getattr(line, 'continue_on_errors', False)
+    repr_limit = line.repr_limit if getattr(line, 'low_memory', False) else None
+    stop = event_type()
+
+    def make_queue(segment):
+        return queue_type(getattr(segment, 'queue_size', None) or queue_size)
+
+    segments = list(line.segments)
+    inbox = make_queue(segments[0] if segments else None)
+    workers = [threading.Thread(target=_feed, args=(iterable, inbox, stop))]
+
+    line.log.info('starting up %d stages', len(segments))
+
+    previous = None
+    for segment, following in zip(segments, segments[1:] + [None]):
+        outbox = make_queue(following)
+        workers.append(worker_type(
+            target=_run_stage,
+            args=(str(line), continue_on_errors, segment, previous, inbox, outbox, stop, repr_limit),
+        ))
+        inbox, previous = outbox, segment
+
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+
+    data = failure = None
+    count = 0
+    try:
+        while True:
+            data = inbox.get()
+            if data is END:
+                break
+            elif failure is not None:
+                continue
+            elif isinstance(data, StageFailure):
+                failure = data
+                stop.set()
+                continue
+            count += 1
+            yield data
+    finally:
+        # drain the stages, if the consumer stopped early
+        stop.set()
+        while data is not END:
+            data = inbox.get()
+        for worker in workers:
+            worker.join()
+
+    if failure is not None:
+        raise failure.exception
+
+    line.log.success('%d outputs were produced.', count)
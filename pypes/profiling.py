@@ -0,0 +1,214 @@
+""" Profile single segments with cProfile and/or tracemalloc.
+
+    Profiling can be switched on per segment through environment variables:
+
+        PYPES_PROFILE:
+            comma separated segment names, whose process calls are
+            profiled with cProfile
+        PYPES_TRACEMALLOC:
+            comma separated segment names, whose process calls are
+            traced with tracemalloc
+        PYPES_PROFILE_DIR:
+            where to put the reports (default: the current directory)
+        PYPES_PROFILE_TOP:
+            how many allocation sites to report (default: 10)
+
+    A segment matches a name, if it is the str of the segment (like
+    'MySegment.first'), the name of its class, or its name attribute.
+
+    The process calls of a matching segment are accumulated in one cProfile
+    profile, and traced with tracemalloc (which only measures the memory
+    peak of every call). Both are dumped once per run, when the program
+    exits (or when dump_profile is called): a .prof file, and a .malloc.txt
+    report of the calls, their highest memory peak, and the top allocation
+    sites since the first call. The profilers are installed when the segment
+    is created, so segments that are not profiled do not pay anything for
+    this feature.
+
+        PYPES_PROFILE=Parser.csv your_program.py
+        python -m pstats Parser.csv.<pid>.1.prof
+
+    >>> import os, tempfile
+    >>> from pypes.pypes import PypeSegment
+    >>> directory = tempfile.mkdtemp()
+    >>> segment = profile_segment(PypeSegment('profiled'), memory=True, directory=directory)
+    >>> for record in range(100):
+    ...     _ = segment.process(record)
+    >>> dump_profile(segment) # doctest: +ELLIPSIS
+    [20] - PypeSegment.profiled - profile of 100 calls written to .../PypeSegment.profiled....1.prof
+    [20] - PypeSegment.profiled - allocation report of 100 calls written to .../PypeSegment.profiled....1.malloc.txt
+    >>> sorted(name.split('.', 3)[-1] for name in os.listdir(directory))
+    ['1.malloc.txt', '1.prof']
+"""
+
+import os
+import itertools
+import threading
+from functools import wraps
+
+from .stats import memory_peak
+from .stats import reset_memory_peak
+
+
+def profiled_names(varname):
+    """ The segment names listed in the environment variable varname.
+
+        >>> os.environ['PYPES_PROFILE'] = 'Parser, Loader.db'
+        >>> sorted(profiled_names('PYPES_PROFILE'))
+        ['Loader.db', 'Parser']
+        >>> del os.environ['PYPES_PROFILE']
+    """
+    return set(name.strip() for name in os.environ.get(varname, '').split(',') if name.strip())
+
+def matches(segment, names):
+    """ Tell if segment is named in names. """
+    return bool(names) and bool(
+        {str(segment), type(segment).__name__, getattr(segment, 'name', None)} & names
+    )
+
+def install_profilers(segment):
+    """ Profile segment, if the environment asks for it. """
+    cpu = matches(segment, profiled_names('PYPES_PROFILE'))
+    memory = matches(segment, profiled_names('PYPES_TRACEMALLOC'))
+    if cpu or memory:
+        profile_segment(segment, cpu=cpu, memory=memory)
+
+def is_profiled(method):
+    return getattr(method, 'profiled', False)
+
+def dump_profile(segment):
+    """ Write the reports of the process calls of segment, profiled so far. """
+    profiler = getattr(segment.process, 'profiler', None)
+    if profiler is not None:
+        profiler.dump()
+
+
+class SegmentProfiler(object):
+
+    """ Accumulates the profile (and memory peaks) of the process calls of segment. """
+
+    def __init__(self, segment, cpu, memory, directory, top):
+        # the profilers are imported here, so unprofiled programs never load them
+        try:
+            import cProfile
+        except ImportError:
+            import profile as cProfile
+        try:
+            import tracemalloc
+        except ImportError: # python 2
+            tracemalloc = None
+
+        if memory and tracemalloc is None:
+            segment.log.warning('tracemalloc is not available, not tracing allocations.')
+            memory = False
+
+        self.segment = segment
+        self.cpu = cpu
+        self.memory = memory
+        self.directory = directory
+        self.top = top
+        self.make_profile = cProfile.Profile
+        self.tracemalloc = tracemalloc
+        self.counter = itertools.count(1)
+        self.lock = threading.RLock()
+        self.depth = 0
+        self.pid = None
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.peak = None
+        self.profile = self.make_profile() if self.cpu else None
+        self.baseline = None
+
+    def wrap(self, process):
+        """ Wrap process, so its calls are profiled. """
+        @wraps(process)
+        def profiled_process(*args, **kwd):
+            with self.lock:
+                # recursive (or concurrent) calls are part of the outer one
+                outer = self.depth == 0
+                self.depth += 1
+                if outer:
+                    self.start()
+            try:
+                return process(*args, **kwd)
+            finally:
+                with self.lock:
+                    self.depth -= 1
+                    if outer:
+                        self.stop()
+
+        profiled_process.profiled = True
+        profiled_process.profiler = self
+        return profiled_process
+
+    def register(self):
+        """ Dump at the exit of this process (also if it is a worker process). """
+        if self.pid is not None:
+            self.reset() # forked, the calls of the parent are dumped there
+        self.pid = os.getpid()
+        # worker processes of multiprocessing do not run the atexit hooks
+        from multiprocessing.util import Finalize
+        Finalize(None, self.dump, exitpriority=10)
+
+    def start(self):
+        if self.pid != os.getpid():
+            self.register()
+        self.calls += 1
+        if self.memory:
+            if not self.tracemalloc.is_tracing():
+                self.tracemalloc.start()
+            if self.baseline is None:
+                self.baseline = self.tracemalloc.take_snapshot()
+            self.peak_base = reset_memory_peak()
+        if self.cpu:
+            self.profile.enable()
+
+    def stop(self):
+        if self.cpu:
+            self.profile.disable()
+        if self.memory and self.peak_base is not None:
+            self.peak = max(self.peak or 0, memory_peak(self.peak_base))
+
+    def dump(self):
+        """ Write the reports of the calls since the last dump. """
+        with self.lock:
+            if not self.calls:
+                return
+            calls, peak, profile, baseline = self.calls, self.peak, self.profile, self.baseline
+            self.reset()
+
+        prefix = os.path.join(self.directory, '{}.{}.{}'.format(self.segment, os.getpid(), next(self.counter)))
+        log = self.segment.log
+
+        if profile is not None:
+            profile.dump_stats(prefix + '.prof')
+            log.info('profile of %d calls written to %s.prof', calls, prefix)
+
+        if baseline is not None:
+            after = self.tracemalloc.take_snapshot()
+            with open(prefix + '.malloc.txt', 'w') as report:
+                report.write('calls: {}\n'.format(calls))
+                if peak is not None:
+                    report.write('highest peak of a call: {} bytes\n'.format(peak))
+                report.write('top allocation sites since the first call:\n')
+                for stat in after.compare_to(baseline, 'lineno')[:self.top]:
+                    report.write('{}\n'.format(stat))
+            log.info('allocation report of %d calls written to %s.malloc.txt', calls, prefix)
+
+
+def profile_segment(segment, cpu=True, memory=False, directory=None, top=None):
+    """ Wrap the process method of segment (the instance only) in profilers.
+
+        Returns the segment, whose process calls will now be profiled. The
+        reports are written at exit, or by dump_profile.
+    """
+    if directory is None:
+        directory = os.environ.get('PYPES_PROFILE_DIR', os.getcwd())
+    if top is None:
+        top = int(os.environ.get('PYPES_PROFILE_TOP', 10))
+
+    profiler = SegmentProfiler(segment, cpu, memory, directory, top)
+    segment.process = profiler.wrap(segment.process)
+    return segment
@@ -15,6 +15,16 @@
 
         * PypeLine:
             A chain of PypeSegments. It can be used as a Segment itself.
+            It can save the output of every segment, to resume processing
+            from there (see pypes.checkpoint), and collect timings of every
+            segment (see pypes.stats).
+            Besides processing one input with process, it can also stream
+            many records lazily through all of its segments (see stream),
+            optionally in batches of records (see process_batch),
+            or process many inputs in parallel (see map), or run its segments
+            as overlapping stages (see pipelined).
+            For many calls on small inputs, it can be compiled into a plan
+            with less overhead per segment (see compile).
 
         * wrap_for_next_segment():
             Call this, how you would call the next processing function and
@@ -31,6 +41,10 @@
             if such a variable is defined,
             a filelogger for that level is created
             and added to the logging facility
+        ASYNC_LOGGING:
+            if set (to anything but 0/no/false/off), loggers only put their
+            records into a queue, and a background thread writes them to
+            stdout and the logfiles (python 3 only)
 
         If you run your_program.py like this:
 
@@ -46,9 +60,21 @@
         the general loglevel (when not debugging) to some higher level.
 """
 
+from .logsetup import ShortRepr
 from .logsetup import setup_logger
-
+from .profiling import install_profilers
+from .profiling import is_profiled
+from .profiling import matches
+from .profiling import profile_segment
+from .stats import PypeStats
+from .stats import memory_peak
+from .stats import reset_memory_peak
+from .stats import wall_clock
+from .stats import cpu_clock
+
+import logging
 from collections import namedtuple
+from itertools import islice
 
 
 NextInput = namedtuple('NextInput', ['args', 'kwd'])
@@ -56,6 +82,44 @@ NextInput = namedtuple('NextInput', ['args', 'kwd'])
 def wrap_for_next_segment(*args, **kwd):
     return NextInput(args, kwd)
 
+def as_next_input(data):
+    """ Use arbitrary return values as first argument to the next process call.
+
+        >>> as_next_input('value')
+        NextInput(args=['value'], kwd={})
+        >>> as_next_input(wrap_for_next_segment(more='value'))
+        NextInput(args=(), kwd={'more': 'value'})
+    """
+    if isinstance(data, NextInput):
+        return data
+    return NextInput([data], {})
+
+def overrides(segment, method_name, base=None):
+    """ Tell if the class of segment overrides the method of base.
+
+        >>> overrides(PypeSegment(), 'process')
+        False
+        >>> overrides(PypeLine(), 'process')
+        True
+    """
+    base = PypeSegment if base is None else base
+    method = getattr(type(segment), method_name)
+    default = getattr(base, method_name)
+    return getattr(method, '__func__', method) is not getattr(default, '__func__', default)
+
+def chunked(iterable, size):
+    """ Split an iterable into lists of (at most) size elements.
+
+        >>> list(chunked(range(5), 2))
+        [[0, 1], [2, 3], [4]]
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
 
 class PypeSegment(object):
 
@@ -74,6 +138,8 @@ class PypeSegment(object):
         NextInput(args=('Hello',), kwd={'world': 'World!'})
     """
     name = 'default'
+    low_memory = False
+    repr_limit = 1000
 
     def __init__(self, name=None):
         """ Set up a convenient processing environment.
@@ -87,6 +153,7 @@ class PypeSegment(object):
             self.name = name
 
         self.log = setup_logger(str(self))
+        install_profilers(self)
 
     def __str__(self):
         return '{}.{}'.format(
@@ -94,6 +161,23 @@ class PypeSegment(object):
             self.name,
         )
 
+    def __getstate__(self):
+        """ Loggers (and profilers) are not pickled, but set up again when unpickling. """
+        state = self.__dict__.copy()
+        state.pop('log', None)
+        if is_profiled(state.get('process')):
+            del state['process']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.log = setup_logger(str(self))
+        install_profilers(self)
+
+    def _loggable(self, data):
+        """ data, or (in low_memory mode) a size-capped repr of it, to log. """
+        return ShortRepr(data, self.repr_limit) if self.low_memory else data
+
     def check_inputs(self, previous=None, *args, **kwd):
         """ Called before processing, to allow early crashing.
 
@@ -120,6 +204,95 @@ class PypeSegment(object):
         """
         return wrap_for_next_segment(*args, **kwd)
 
+    def process_item(self, *args, **kwd):
+        """ Process one record of a stream.
+
+            This default implementation just calls process, so every
+            segment can be streamed without further ado.
+        """
+        return self.process(*args, **kwd)
+
+    def process_stream(self, stream):
+        """ Lazily process an iterable of records and yield the outputs.
+
+            Override this to process the stream in chunks, or to filter or
+            expand records. Only one record at a time is pulled from the
+            stream by this default implementation.
+
+            >>> list(PypeSegment('stream').process_stream(['a', 'b']))
+            [NextInput(args=('a',), kwd={}), NextInput(args=('b',), kwd={})]
+        """
+        for data in stream:
+            data = as_next_input(data)
+            yield self.process_item(*data.args, **data.kwd)
+
+    def process_batch(self, batch):
+        """ Process a batch of records at once, and return a list of outputs.
+
+            The records are the raw outputs of the previous segment (or
+            NextInput objects). Override this, to process many records per
+            call, for example with vectorized code. This default implementation
+            falls back to calling process for every record.
+
+            >>> PypeSegment('batch').process_batch(['a', wrap_for_next_segment(b=1)])
+            [NextInput(args=('a',), kwd={}), NextInput(args=(), kwd={'b': 1})]
+        """
+        process = self.process
+        return [
+            process(*data.args, **data.kwd)
+            for data in map(as_next_input, batch)
+        ]
+
+    def stream(self, iterable, batch_size=None):
+        """ Stream the records of iterable through this segment.
+
+            If batch_size is given, the records are chunked into batches
+            of that size, which are then processed through process_batch.
+            With batch_size='auto' (or a pypes.batching.AutoBatcher), the
+            size of every batch is adapted to the measured processing time.
+
+            Returns a generator, so nothing is processed until the
+            outputs are consumed.
+
+            >>> list(PypeSegment('batched').stream(['a', 'b', 'c'], batch_size=2))
+            [NextInput(args=('a',), kwd={}), NextInput(args=('b',), kwd={}), NextInput(args=('c',), kwd={})]
+            >>> PypeSegment('batched').stream(['a'], batch_size=0)
+            Traceback (most recent call last):
+            ...
+            ValueError: batch_size must be a positive int, 'auto' or an AutoBatcher, not 0
+        """
+        if batch_size is None:
+            return self.process_stream(iter(iterable))
+        if isinstance(batch_size, bool) or isinstance(batch_size, int) and batch_size < 1:
+            msg = 'batch_size must be a positive int, \'auto\' or an AutoBatcher, not {!r}'
+            raise ValueError(msg.format(batch_size))
+        if isinstance(batch_size, int):
+            return self._batch_stream(iterable, batch_size)
+        from .batching import auto_batch_stream
+        return auto_batch_stream(self, iterable, batch_size)
+
+    def _batch_stream(self, iterable, batch_size):
+        for batch in chunked(iterable, batch_size):
+            for data in self.process_batch(batch):
+                yield data
+
+    def map(self, inputs, workers=None, executor='process', ordered=True, shared_memory=False):
+        """ Process many independent inputs in parallel.
+
+            The whole segment is run in each of the workers of a process
+            (or thread) pool. See pypes.parallel.pype_map for details.
+        """
+        from .parallel import pype_map
+        return pype_map(self, inputs, workers, executor, ordered, shared_memory)
+
+    def warm_pool(self, workers=None):
+        """ Start long-lived workers, that serve process calls of this segment.
+
+            See pypes.parallel.WarmPool for details.
+        """
+        from .parallel import WarmPool
+        return WarmPool(self, workers)
+
 
 
 class PypeLine(PypeSegment):
@@ -144,16 +317,76 @@ class PypeLine(PypeSegment):
     """
 
     continue_on_errors = False
+    checkpoints = None
+    collect_stats = False
+    measure_bytes = False
+    flatten = False
 
-    def __init__(self, segments=None, name=None, continue_on_errors=None):
+    def __init__(self, segments=None, name=None, continue_on_errors=None,
+                 checkpoints=None, collect_stats=None, flatten=None, low_memory=None):
         """ We add the segments argument as the new first
             argument, since it is more important, but we
             perserve the name argument.
+
+            checkpoints may be a pypes.checkpoint.CheckpointStore,
+            to save the output of every segment, and resume from there.
+
+            With collect_stats, timings of every segment are collected
+            in self.stats (see pypes.stats).
+
+            With flatten, nested PypeLines are not called, but their
+            segments are processed directly by this line's loop. Their
+            messages are still logged through the nested line's logger, and
+            failures are handled by the nested line (by its continue_on_errors).
+            Only the 'starting up' and 'output was produced' messages of the
+            nested lines are skipped (see flattened). Nested lines with another
+            continue_on_errors than their owner are not flattened, so errors
+            are handled just like without flatten.
+
+            With low_memory, the line holds no references to outputs, that
+            were consumed by the next segment, and inputs and outputs are
+            logged with reprs capped at repr_limit characters. If stats are
+            collected, the memory peak of every segment is measured (with
+            tracemalloc, which then slows down all allocations).
         """
         super(PypeLine, self).__init__(name)
         self.segments = [] if segments is None else segments
+        self.stats = PypeStats()
         if continue_on_errors is not None:
             self.continue_on_errors = continue_on_errors
+        if checkpoints is not None:
+            self.checkpoints = checkpoints
+        if collect_stats is not None:
+            self.collect_stats = collect_stats
+        if flatten is not None:
+            self.flatten = flatten
+        if low_memory is not None:
+            self.low_memory = low_memory
+
+    def pipelined(self, iterable, executor='thread', queue_size=1):
+        """ Stream records through the segments running as parallel stages.
+
+            See pypes.pipelined.pipelined for details.
+        """
+        from .pipelined import pipelined
+        return pipelined(self, iterable, executor, queue_size)
+
+    def compile(self):
+        """ Build a fused, quiet execution plan of this line.
+
+            See pypes.compiled for details.
+        """
+        from .compiled import CompiledPypeLine
+        return CompiledPypeLine(self)
+
+    def profile(self, names, cpu=True, memory=False, directory=None, top=None):
+        """ Profile the process calls of the segments named in names.
+
+            See pypes.profiling for details.
+        """
+        for segment in self.segments:
+            if matches(segment, set(names)):
+                profile_segment(segment, cpu, memory, directory, top)
 
     def check_inputs(self, previous=None, *args, **kwd):
         """ Pass the check_inputs call to the first element. """
@@ -163,46 +396,393 @@ class PypeLine(PypeSegment):
     def process(self, *args, **kwd):
         """ Process inputs and deliver an output. """
 
-        self.log.info('starting up')
+        # the enabled levels are looked up once per run, not once per segment
+        log = self.log
+        debug = log.isEnabledFor(logging.DEBUG)
+        info = log.isEnabledFor(logging.INFO)
+
+        # the extra fields (event, segment, duration) are for structured sinks
+        run_started = wall_clock()
+        if info:
+            log.info('starting up', extra=dict(event='start'))
 
         data = NextInput(args, kwd)
         previous = None
-
-        for segment in self.segments:
+        start = 0
+
+        # with flatten, every segment is processed on behalf of its owner line
+        owner, owners, segments = self, None, self.segments
+        if self.flatten:
+            owners, segments = flattened(self)
+
+        stats = self.stats if self.collect_stats else None
+        if stats is not None:
+            stats.prepare(segments)
+            stats.runs += 1
+        measure_peaks = stats is not None and self.low_memory
+
+        # after a failure, the outputs are not saved (a rerun should retry)
+        checkpoints = self.checkpoints
+        if checkpoints is not None:
+            fingerprint = checkpoints.fingerprint(self, data)
+            index, saved = checkpoints.resume(self, fingerprint, len(segments))
+            if index is not None:
+                previous, data = segments[index], saved
+                saved = None
+                start = index + 1
+                log.info('resuming after %s', previous)
+
+        for index, segment in enumerate(islice(segments, start, None), start):
+
+            if owners is not None:
+                owner = owners[index]
+                log = owner.log
 
             # use arbitrary return values as first argument to the process call
-            if not isinstance(data, NextInput):
-                data = NextInput([data], {})
+            data = as_next_input(data)
 
-            self.log.debug('next input: %s', data)
+            if debug:
+                log.debug('next input: %s', owner._loggable(data))
+
+            if info:
+                began = wall_clock()
+
+            if stats is not None:
+                data_in = data
+                started, cpu_started = wall_clock(), cpu_clock()
+                if measure_peaks:
+                    peak_base = reset_memory_peak()
 
             try:
                 # let the next segment check the input (and probably crash early)
                 segment.check_inputs(previous, *data.args, **data.kwd)
-                self.log.info('%s says input is ok', segment)
+                if stats is not None:
+                    checked = wall_clock()
+                if info:
+                    log.info('%s says input is ok', segment, extra=dict(
+                        event='ok', segment=str(segment), duration=wall_clock() - began,
+                    ))
 
                 # do the processing
+                if stats is not None:
+                    processing = wall_clock()
                 data = segment.process(*data.args, **data.kwd)
-                self.log.info('%s is done', segment)
+                if stats is not None:
+                    stats.record(index, started, checked, cpu_started, wall_clock(), cpu_clock(), processing=processing)
+                    if self.measure_bytes:
+                        stats.record_bytes(index, data_in, data)
+                    data_in = None
+                    if measure_peaks and peak_base is not None:
+                        stats.record_peak(index, memory_peak(peak_base))
+                if info:
+                    log.info('%s is done', segment, extra=dict(
+                        event='done', segment=str(segment), duration=wall_clock() - began,
+                    ))
 
             except Exception:
-                if self.continue_on_errors:
-                    self.log.warning(
-                        '%s failed, but processing will continue.', segment,
-                        exc_info=True,
-                    )
-                else:
-                    self.log.error(
-                        '%s could not process %r\n',
-                        segment, data,
-                        exc_info=True, # add traceback information to the exception
-                    )
-                    raise
+                if stats is not None:
+                    stats.record_failure(index)
+                owner._segment_failed(segment, data)
+                checkpoints = None
+
+            if checkpoints is not None:
+                checkpoints.save(self, fingerprint, index, data)
 
             # goto next
             previous = segment
 
-        self.log.success('output was produced.')
-        self.log.debug('output was %r', data)
+        log = self.log
+        log.success('output was produced.', extra=dict(event='end', duration=wall_clock() - run_started))
+        if debug:
+            log.debug('output was %r', self._loggable(data))
+        if stats is not None:
+            log.success('segment statistics:\n%s', stats)
 
         return data
+
+    def process_stream(self, stream):
+        """ Lazily push a stream of records through all segments.
+
+            Each record flows through the whole chain before the next one is
+            read from the stream, so memory stays bounded by the size of a
+            record, and the first outputs are available right away.
+
+            With continue_on_errors, a record that a segment fails to process
+            is passed on unchanged (just like in process). Segments that
+            override process_stream get the records that passed their
+            check_inputs, and failing records are dropped.
+
+            >>> pype = PypeLine([PypeSegment('noop')], name='stream-test')
+            >>> for output in pype.stream(['a', 'b']):
+            ...     print(output)
+            [20] - PypeLine.stream-test - starting up
+            NextInput(args=('a',), kwd={})
+            NextInput(args=('b',), kwd={})
+            [25] - PypeLine.stream-test - 2 outputs were produced.
+        """
+
+        run_started = wall_clock()
+        self.log.info('starting up', extra=dict(event='start'))
+
+        previous = None
+        for segment in self.segments:
+            if overrides(segment, 'process_stream'):
+                checked = self._check_stream(segment, previous, stream)
+                stream = segment.process_stream(checked)
+            else:
+                stream = self._item_stream(segment, previous, stream)
+            previous = segment
+
+        count = 0
+        for data in stream:
+            count += 1
+            yield data
+
+        self.log.success('%d outputs were produced.', count, extra=dict(
+            event='end', duration=wall_clock() - run_started,
+        ))
+
+    def process_batch(self, batch):
+        """ Push a batch of records through all segments.
+
+            Every segment gets the whole batch through its process_batch,
+            so the logging happens once per batch, not once per record.
+            Inputs are still checked record by record, but only for segments
+            that override check_inputs. Segments with the default process_batch
+            are run record by record right here, so with continue_on_errors
+            only the failing records are passed on unchanged (just like in
+            process_stream). A segment, that overrides process_batch and fails
+            on a batch, is run again on its records one by one (so its
+            process_batch should not have side effects before it fails).
+
+            >>> pype = PypeLine([PypeSegment('noop')], name='batch-test')
+            >>> pype.process_batch(['a', 'b'])
+            [20] - PypeLine.batch-test - starting up with 2 records
+            [20] - PypeLine.batch-test - PypeSegment.noop is done
+            [25] - PypeLine.batch-test - batch output was produced.
+            [NextInput(args=('a',), kwd={}), NextInput(args=('b',), kwd={})]
+
+            A failing record does not spoil its batch:
+
+            >>> class Boom(PypeSegment):
+            ...     def process(self, record):
+            ...         if record == 3:
+            ...             raise ValueError(record)
+            ...         return record
+            >>> pype = PypeLine([Boom('boom')], name='batch-errors', continue_on_errors=True)
+            >>> pype.log.setLevel(logging.CRITICAL)
+            >>> list(pype.stream(range(6), batch_size=4))
+            [0, 1, 2, NextInput(args=[3], kwd={}), 4, 5]
+            >>> list(pype.stream(range(6)))
+            [0, 1, 2, NextInput(args=[3], kwd={}), 4, 5]
+        """
+
+        run_started = wall_clock()
+        self.log.info('starting up with %d records', len(batch), extra=dict(event='start'))
+
+        stats = self.stats if self.collect_stats else None
+        if stats is not None:
+            stats.prepare(self.segments)
+            stats.runs += 1
+            stats.record_batch(len(batch))
+
+        previous = None
+        for index, segment in enumerate(self.segments):
+
+            began = wall_clock()
+            if stats is not None:
+                items = len(batch)
+                started, cpu_started = began, cpu_clock()
+
+            if not overrides(segment, 'process_batch'):
+                # the default process_batch, but failures are handled per record
+                batch = self._process_records(segment, previous, batch, stats, index)
+                if stats is not None:
+                    stats.record(index, started, started, cpu_started, wall_clock(), cpu_clock(), items)
+                self.log.info('%s is done', segment, extra=dict(
+                    event='done', segment=str(segment), duration=wall_clock() - began,
+                ))
+                previous = segment
+                continue
+
+            try:
+                if overrides(segment, 'check_inputs'):
+                    for data in map(as_next_input, batch):
+                        segment.check_inputs(previous, *data.args, **data.kwd)
+                if stats is not None:
+                    checked = wall_clock()
+
+                batch = segment.process_batch(batch)
+                if stats is not None:
+                    stats.record(index, started, checked, cpu_started, wall_clock(), cpu_clock(), items)
+                self.log.info('%s is done', segment, extra=dict(
+                    event='done', segment=str(segment), duration=wall_clock() - began,
+                ))
+
+            except Exception:
+                if stats is not None:
+                    stats.record_failure(index)
+                if not self.continue_on_errors:
+                    self._segment_failed(segment, batch)
+                self.log.info('%s failed on the batch, retrying its records one by one', segment)
+                batch = self._process_records(segment, previous, batch, stats, index)
+
+            previous = segment
+
+        self.log.success('batch output was produced.', extra=dict(
+            event='end', duration=wall_clock() - run_started,
+        ))
+        if stats is not None:
+            self.log.success('segment statistics:\n%s', stats)
+
+        return batch
+
+    def _process_records(self, segment, previous, batch, stats=None, index=None):
+        """ Check and process the records of batch one by one, and return the outputs.
+
+            A failing record is passed on unchanged (with continue_on_errors).
+        """
+        check = overrides(segment, 'check_inputs')
+        process = segment.process
+        outputs = []
+        for data in map(as_next_input, batch):
+            try:
+                if check:
+                    segment.check_inputs(previous, *data.args, **data.kwd)
+                data = process(*data.args, **data.kwd)
+            except Exception:
+                if stats is not None:
+                    stats.record_failure(index)
+                self._segment_failed(segment, data)
+            outputs.append(data)
+        return outputs
+
+    def _item_stream(self, segment, previous, stream):
+        """ Check and process the records of stream one by one. """
+        debug = self.log.isEnabledFor(logging.DEBUG)
+        for data in stream:
+            data = as_next_input(data)
+            if debug:
+                self.log.debug('next input: %s', self._loggable(data))
+            try:
+                segment.check_inputs(previous, *data.args, **data.kwd)
+                data = segment.process_item(*data.args, **data.kwd)
+            except Exception:
+                self._segment_failed(segment, data)
+            yield data
+
+    def _check_stream(self, segment, previous, stream):
+        """ Yield the records of stream that pass the check_inputs of segment. """
+        debug = self.log.isEnabledFor(logging.DEBUG)
+        for data in stream:
+            data = as_next_input(data)
+            if debug:
+                self.log.debug('next input: %s', self._loggable(data))
+            try:
+                segment.check_inputs(previous, *data.args, **data.kwd)
+            except Exception:
+                self._segment_failed(segment, data)
+                continue
+            yield data
+
+    def _segment_failed(self, segment, data):
+        """ Log the failure of segment, and re-raise if processing should stop.
+
+            Must be called from within an except block.
+        """
+        if self.continue_on_errors:
+            self.log.warning(
+                '%s failed, but processing will continue.', segment,
+                exc_info=True, extra=dict(event='fail', segment=str(segment)),
+            )
+        else:
+            self.log.error(
+                '%s could not process %r\n',
+                segment, self._loggable(data),
+                exc_info=True, # add traceback information to the exception
+                extra=dict(event='fail', segment=str(segment)),
+            )
+            raise
+
+
+def is_chain(segment):
+    """ Tell if segment is a PypeLine, that processes its segments as a plain chain.
+
+        >>> is_chain(PypeLine([]))
+        True
+        >>> is_chain(PypeSegment())
+        False
+    """
+    return (
+        isinstance(segment, PypeLine)
+        and not overrides(segment, 'process', PypeLine)
+        and not overrides(segment, 'check_inputs', PypeLine)
+        and 'process' not in vars(segment)
+    )
+
+def is_flattenable(segment):
+    """ Tell if segment is a plain PypeLine, that can be replaced by its segments.
+
+        Subclasses with their own processing (like PypeGraph), and lines
+        that collect statistics or checkpoints are kept as they are.
+
+        >>> is_flattenable(PypeLine([]))
+        True
+        >>> is_flattenable(PypeLine([], collect_stats=True))
+        False
+        >>> is_flattenable(PypeSegment())
+        False
+    """
+    return (
+        is_chain(segment)
+        and not segment.collect_stats
+        and segment.checkpoints is None
+    )
+
+def flatten(line):
+    """ Yield (owner, segment) for all leaf segments of line.
+
+        The owner is the (possibly nested) PypeLine, that the segment
+        belongs to. Nested lines, whose continue_on_errors differs from
+        their owner's, are kept as they are: only their owner could decide
+        to continue after they re-raised.
+
+        >>> strict = PypeLine([PypeSegment('strict-one')], name='strict')
+        >>> lenient = PypeLine([strict, PypeSegment('two')], continue_on_errors=True)
+        >>> [str(segment) for owner, segment in flatten(lenient)]
+        ['PypeLine.strict', 'PypeSegment.two']
+    """
+    for segment in line.segments:
+        if is_flattenable(segment) and segment.continue_on_errors == line.continue_on_errors:
+            for owned in flatten(segment):
+                yield owned
+        else:
+            yield line, segment
+
+def flattened(line):
+    """ Return the lists of owners and leaf segments of line.
+
+        A nested line checks the inputs of its first segment only once,
+        instead of once from the outer line and once more from itself.
+
+        >>> inner = PypeLine([PypeSegment('two'), PypeSegment('three')], name='flat-inner')
+        >>> outer = PypeLine([PypeSegment('one'), inner], name='flat-outer', flatten=True)
+        >>> owners, segments = flattened(outer)
+        >>> [str(owner) for owner in owners]
+        ['PypeLine.flat-outer', 'PypeLine.flat-inner', 'PypeLine.flat-inner']
+        >>> outer.process()
+        [20] - PypeLine.flat-outer - starting up
+        [20] - PypeLine.flat-outer - PypeSegment.one says input is ok
+        [20] - PypeLine.flat-outer - PypeSegment.one is done
+        [20] - PypeLine.flat-inner - PypeSegment.two says input is ok
+        [20] - PypeLine.flat-inner - PypeSegment.two is done
+        [20] - PypeLine.flat-inner - PypeSegment.three says input is ok
+        [20] - PypeLine.flat-inner - PypeSegment.three is done
+        [25] - PypeLine.flat-outer - output was produced.
+        NextInput(args=(), kwd={})
+    """
+    owners, segments = [], []
+    for owner, segment in flatten(line):
+        owners.append(owner)
+        segments.append(segment)
+    return owners, segments
@@ -0,0 +1,183 @@
+""" Hand large buffers to worker processes by reference instead of by copy.
+
+    Normally every argument of a segment is pickled when it crosses a process
+    boundary, so a big numpy array or bytes object is copied (at least) twice
+    per worker call. A SharedMemoryArena instead writes such buffers once to
+    a memory-mapped file (in /dev/shm, if available), and only a small
+    SharedBuffer reference is pickled. The receiving process maps the file,
+    and gets a zero-copy, read-only view:
+
+        * numpy arrays arrive as read-only numpy arrays
+        * bytes, bytearrays and other buffers arrive as read-only memoryviews
+
+    The runner owns the arena: it removes the files of the inputs when the
+    run is over. Outputs shared by the workers are removed as soon as the
+    runner mapped them. Since a mapping outlives its file, the views stay
+    valid for as long as they are referenced, and the memory is freed after.
+    All files of an arena (also those created by the workers) share a
+    prefix, so closing the arena removes any outputs, that were never
+    mapped (say, because the consumer stopped early).
+
+    >>> arena = SharedMemoryArena(threshold=8)
+    >>> shared = arena.share(b'large enough')
+    >>> shared
+    SharedBuffer(size=12, kind='bytes')
+    >>> import pickle
+    >>> bytes(pickle.loads(pickle.dumps(shared)).get())
+    b'large enough'
+    >>> arena.share(b'tiny')
+    b'tiny'
+    >>> arena.close()
+"""
+
+import os
+import glob
+import mmap
+import uuid
+import tempfile
+
+from .pypes import NextInput
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def default_directory():
+    """ Prefer a memory backed filesystem for the buffer files. """
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+def is_array(obj):
+    return numpy is not None and isinstance(obj, numpy.ndarray)
+
+def buffer_size(obj):
+    """ The size of obj, if it is a buffer, that can be shared, else None.
+
+        >>> buffer_size(b'12345')
+        5
+        >>> buffer_size('not a buffer')
+    """
+    if is_array(obj):
+        return obj.nbytes
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return memoryview(obj).nbytes
+    return None
+
+
+class SharedBuffer(object):
+
+    """ A picklable reference to a buffer in a memory-mapped file. """
+
+    def __init__(self, path, size, kind='bytes', dtype=None, shape=None):
+        self.path = path
+        self.size = size
+        self.kind = kind
+        self.dtype = dtype
+        self.shape = shape
+
+    def __repr__(self):
+        return 'SharedBuffer(size={}, kind={!r})'.format(self.size, self.kind)
+
+    def get(self, unlink=False):
+        """ Map the file and return a read-only view of the buffer.
+
+            With unlink, the file is removed right away (the mapping
+            stays valid until the view is garbage collected).
+        """
+        with open(self.path, 'rb') as shared:
+            mapped = mmap.mmap(shared.fileno(), self.size, access=mmap.ACCESS_READ)
+        if unlink:
+            os.remove(self.path)
+        if self.kind == 'array':
+            return numpy.frombuffer(mapped, dtype=self.dtype).reshape(self.shape)
+        return memoryview(mapped)
+
+
+class SharedMemoryArena(object):
+
+    """ Creates the files of shared buffers, and removes them on close.
+
+        Only buffers of at least threshold bytes are shared, smaller ones
+        are cheaper to pickle. Arenas are picklable, so workers can share
+        their outputs through the same directory.
+    """
+
+    def __init__(self, directory=None, threshold=1024 * 1024):
+        self.directory = default_directory() if directory is None else directory
+        self.threshold = threshold
+        self.prefix = 'pypes-{}-{}-'.format(os.getpid(), uuid.uuid4().hex[:8])
+        self.paths = []
+
+    def __getstate__(self):
+        return dict(directory=self.directory, threshold=self.threshold, prefix=self.prefix, paths=[])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def share(self, obj):
+        """ Return a SharedBuffer of obj, if it is a large buffer, else obj. """
+        size = buffer_size(obj)
+        if size is None or size < max(self.threshold, 1):
+            return obj
+
+        if is_array(obj):
+            obj = numpy.ascontiguousarray(obj)
+            shared = dict(kind='array', dtype=obj.dtype.str, shape=obj.shape)
+        else:
+            shared = dict(kind='bytes')
+
+        descriptor, path = tempfile.mkstemp(prefix=self.prefix, dir=self.directory)
+        with os.fdopen(descriptor, 'wb') as target:
+            target.write(memoryview(obj).cast('B'))
+        self.paths.append(path)
+        return SharedBuffer(path, size, **shared)
+
+    def share_input(self, data):
+        """ Share the large args and keywords of a NextInput. """
+        return NextInput(
+            [self.share(arg) for arg in data.args],
+            dict((key, self.share(value)) for key, value in data.kwd.items()),
+        )
+
+    def share_output(self, data):
+        """ Share a large output (or the large args and keywords of it). """
+        if isinstance(data, NextInput):
+            return self.share_input(data)
+        return self.share(data)
+
+    def resolve(self, data, unlink=False):
+        """ Replace SharedBuffers in an output or NextInput by their views. """
+        def get(obj):
+            return obj.get(unlink) if isinstance(obj, SharedBuffer) else obj
+        if isinstance(data, NextInput):
+            return NextInput(
+                [get(arg) for arg in data.args],
+                dict((key, get(value)) for key, value in data.kwd.items()),
+            )
+        return get(data)
+
+    def discard(self, data):
+        """ Remove the files of the SharedBuffers in an output or NextInput, without mapping them. """
+        shared = list(data.args) + list(data.kwd.values()) if isinstance(data, NextInput) else [data]
+        for obj in shared:
+            if isinstance(obj, SharedBuffer):
+                remove(obj.path)
+
+    def close(self):
+        """ Remove the files of all buffers shared through this arena (or its copies). """
+        for path in self.paths + glob.glob(os.path.join(self.directory, self.prefix + '*')):
+            remove(path)
+        self.paths = []
+
+
+def remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
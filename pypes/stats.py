@@ -0,0 +1,198 @@
+""" Timing and throughput statistics of PypeLine runs.
+
+    A PypeLine with collect_stats set records for every segment:
+        * calls: how often the segment was run
+        * items: how many records it processed (batches count every record)
+        * failures: how often it raised
+        * wall_time / cpu_time: time spent in check_inputs and process
+        * check_time / process_time: the wall time split up between the two
+        * bytes_in / bytes_out: the size of the in- and outputs
+                                (only if the line has measure_bytes set)
+        * peak_bytes: the highest memory peak during one call (traced
+                      with tracemalloc, only if the line has low_memory set)
+
+    Batches processed through process_batch are counted by their size in
+    batch_sizes (so the sizes chosen by a pypes.batching.AutoBatcher show).
+
+    The statistics are accumulated over all runs in line.stats, and a
+    summary is logged at the end of every run, so the bottleneck segment
+    can be spotted without attaching a profiler.
+
+    >>> stats = PypeStats()
+    >>> stats.prepare(['PypeSegment.one', 'PypeSegment.two'])
+    >>> stats.record(0, started=0.0, checked=0.5, cpu_started=0.0, finished=1.0, cpu_finished=0.25)
+    >>> stats.record(1, started=1.0, checked=1.0, cpu_started=0.5, finished=3.0, cpu_finished=1.5)
+    >>> stats.bottleneck().name
+    'PypeSegment.two'
+    >>> print(stats) # doctest: +NORMALIZE_WHITESPACE
+    segment          calls  items  fails   wall [s]    cpu [s]  check [s]  process [s]
+    PypeSegment.one      1      1      0      1.000      0.250      0.500        0.500
+    PypeSegment.two      1      1      0      2.000      1.000      0.000        2.000
+"""
+
+import sys
+
+try:
+    from time import perf_counter as wall_clock
+    from time import process_time as cpu_clock
+except ImportError: # python 2
+    from time import time as wall_clock
+    from time import clock as cpu_clock
+
+
+def payload_size(data):
+    """ Estimate the size (in bytes) of a segment in- or output.
+
+        Buffers (bytes, arrays, ...) report their real size, other objects
+        just their shallow size, to keep the measurement cheap.
+
+        >>> payload_size(b'12345')
+        5
+        >>> payload_size(bytearray(10))
+        10
+
+        The arguments of a NextInput are summed up:
+
+        >>> from pypes.pypes import wrap_for_next_segment
+        >>> payload_size(wrap_for_next_segment(b'12345', more=b'12345'))
+        10
+    """
+    if isinstance(data, tuple) and hasattr(data, 'args') and hasattr(data, 'kwd'):
+        return sum(map(payload_size, data.args)) + sum(map(payload_size, data.kwd.values()))
+    nbytes = getattr(data, 'nbytes', None)
+    if nbytes is not None:
+        return nbytes
+    if isinstance(data, (bytes, bytearray)):
+        return len(data)
+    return sys.getsizeof(data)
+
+def reset_memory_peak():
+    """ Start measuring a memory peak, and return the currently traced size.
+
+        tracemalloc is started, if it is not tracing yet (which slows down
+        all allocations from then on). Returns None, if peaks can not be
+        measured (before python 3.9).
+    """
+    try:
+        import tracemalloc
+    except ImportError: # python 2
+        return None
+    if not hasattr(tracemalloc, 'reset_peak'):
+        return None
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    return tracemalloc.get_traced_memory()[0]
+
+def memory_peak(base):
+    """ The peak of traced memory above base, since reset_memory_peak. """
+    import tracemalloc
+    return tracemalloc.get_traced_memory()[1] - base
+
+
+class SegmentStats(object):
+
+    """ The accumulated statistics of one segment. """
+
+    __slots__ = (
+        'name', 'calls', 'items', 'failures',
+        'wall_time', 'cpu_time', 'check_time', 'process_time',
+        'bytes_in', 'bytes_out', 'peak_bytes',
+    )
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = self.items = self.failures = 0
+        self.wall_time = self.cpu_time = self.check_time = self.process_time = 0.0
+        self.bytes_in = self.bytes_out = self.peak_bytes = 0
+
+    def as_dict(self):
+        return dict((attr, getattr(self, attr)) for attr in self.__slots__)
+
+
+class PypeStats(object):
+
+    """ The statistics of all segments of a PypeLine, by segment index. """
+
+    def __init__(self):
+        self.segments = []
+        self.runs = 0
+        self.batch_sizes = {}
+
+    def prepare(self, segments):
+        """ Make sure there are statistics for every one of segments. """
+        names = [str(segment) for segment in segments]
+        if [entry.name for entry in self.segments] != names:
+            self.segments = [SegmentStats(name) for name in names]
+
+    def reset(self):
+        self.segments = []
+        self.runs = 0
+        self.batch_sizes = {}
+
+    def record(self, index, started, checked, cpu_started, finished, cpu_finished, items=1, processing=None):
+        """ Add the timings of one call of the segment at index.
+
+            If processing (the time process was called) is not given,
+            processing started right after the check.
+        """
+        entry = self.segments[index]
+        entry.calls += 1
+        entry.items += items
+        entry.wall_time += finished - started
+        entry.cpu_time += cpu_finished - cpu_started
+        entry.check_time += checked - started
+        entry.process_time += finished - (checked if processing is None else processing)
+
+    def record_bytes(self, index, data_in, data_out):
+        entry = self.segments[index]
+        entry.bytes_in += payload_size(data_in)
+        entry.bytes_out += payload_size(data_out)
+
+    def record_peak(self, index, peak):
+        entry = self.segments[index]
+        entry.peak_bytes = max(entry.peak_bytes, peak)
+
+    def record_batch(self, size):
+        self.batch_sizes[size] = self.batch_sizes.get(size, 0) + 1
+
+    def record_failure(self, index):
+        self.segments[index].failures += 1
+
+    def bottleneck(self):
+        """ The statistics of the segment with the most wall time. """
+        if self.segments:
+            return max(self.segments, key=lambda entry: entry.wall_time)
+
+    def as_dict(self):
+        return dict(
+            runs=self.runs,
+            segments=[entry.as_dict() for entry in self.segments],
+            batch_sizes=dict(self.batch_sizes),
+        )
+
+    def summary(self):
+        """ A table of the statistics, one line per segment. """
+        width = max([len('segment')] + [len(entry.name) for entry in self.segments])
+        header = '{:<{w}} {:>6} {:>6} {:>6} {:>10} {:>10} {:>10} {:>12}'.format(
+            'segment', 'calls', 'items', 'fails',
+            'wall [s]', 'cpu [s]', 'check [s]', 'process [s]', w=width,
+        )
+        lines = [header]
+        for entry in self.segments:
+            lines.append('{:<{w}} {:>6} {:>6} {:>6} {:>10.3f} {:>10.3f} {:>10.3f} {:>12.3f}'.format(
+                entry.name, entry.calls, entry.items, entry.failures,
+                entry.wall_time, entry.cpu_time, entry.check_time, entry.process_time,
+                w=width,
+            ))
+            if entry.bytes_in or entry.bytes_out:
+                lines[-1] += ' {:>12d} B in {:>12d} B out'.format(entry.bytes_in, entry.bytes_out)
+            if entry.peak_bytes:
+                lines[-1] += ' {:>12d} B peak'.format(entry.peak_bytes)
+        if self.batch_sizes:
+            lines.append('batch sizes: ' + ', '.join(
+                '{} x {}'.format(count, size) for size, count in sorted(self.batch_sizes.items())
+            ))
+        return '\n'.join(lines)
+
+    __str__ = summary
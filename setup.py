@@ -32,7 +32,9 @@ setup_args.update(
 # Requirements
 
 setup_args.update(
-    install_requires=[],
+    install_requires=[
+        'futures; python_version<"3"', # concurrent.futures, for PypeGraph and map
+    ],
 )
 
 
@@ -326,16 +326,26 @@ def import_commands_to_override(oldschool=False):
 
 import_commands_to_override()
 
+def build_py_run(self=None):
+    """ Build as usual, then render the static _version.py into the build,
+        so the installed package does not ask git for its version on import.
+
+        >>> build_py_run()
+    """
+    if not self: return
+    _build_py.run(self)
+
+    source_versionfile, build_versionfile = read_setup_cfg()
+    target_versionfile = os.path.join(self.build_lib, build_versionfile)
+    if versionfile and os.path.exists(target_versionfile):
+        print("== Rendering static versionfile to: %s" % target_versionfile)
+        os.unlink(target_versionfile)
+        with open(target_versionfile, 'w') as fh: fh.write(versionfile.render_static_file())
+
 class cmd_build_py(_build_py):
     """ It seems as if build_py is executed when the distributed package is installed. """
 
-    #def run(self):
-        #_build_py.run(self)
-        # now locate _version.py in the new build/ directory and replace
-        # it with an updated value
-        #deploy_to = build_versionfile
-        #print("== Deploying %s" % deploy_to)
-        #deploy_versionfile(deploy_to)
+    run = build_py_run
 
 
 #if "cx_Freeze" in sys.modules:  # cx_freeze enabled?